@@ -1,5 +1,18 @@
 /** @type {import('next').NextConfig} */
 const nextConfig = {
+  async headers() {
+    return [
+      {
+        // шарды событий с хэшем содержимого в имени (tools/parser.py --export-shards)
+        source: '/assets/data/events/:shard([0-9a-z-]+\\.[0-9a-f]{12}\\.json)',
+        headers: [{ key: 'Cache-Control', value: 'public, max-age=31536000, immutable' }]
+      },
+      {
+        source: '/assets/data/events/manifest.json',
+        headers: [{ key: 'Cache-Control', value: 'no-cache' }]
+      }
+    ];
+  },
   async rewrites() {
     return [
       { source: '/', destination: '/index.html' },
@@ -2,6 +2,25 @@
   "use strict";
 
   const DATA_URL = "assets/data/events.json";
+  // шарды по месяцам (tools/parser.py --export-shards): имена с хэшем, кэшируются навсегда,
+  // перезапрашивается только маленький манифест
+  const SHARDS_BASE = "assets/data/events/";
+  const MANIFEST_URL = SHARDS_BASE + "manifest.json";
+  // поисковый индекс (tools/parser.py --search-index): термин -> id событий
+  const INDEX_URL = "assets/data/events-index.json";
+
+  // нормализация — ровно как search_tokens/stem_ru в tools/parser.py
+  const SEARCH_STOPWORDS = new Set(
+    "и в во на с со по о об к ко за от до из у для не но а или что как это the and of to in".split(" ")
+  );
+  const SEARCH_SUFFIXES = (
+    "иями ами ями ого его ому ему ыми ими иях иям ой ей ий ый ая яя ое ее ые ие ых их ым им ия ии ию " +
+    "ов ев ам ям ах ях ом ем ую юю ью а я о е ы и у ю ь"
+  )
+    .split(" ")
+    .sort(function (a, b) {
+      return b.length - a.length;
+    });
 
   const listNode = document.getElementById("events-archive-list");
   if (!listNode) return;
@@ -235,12 +254,82 @@
     });
   }
 
+  function stemRu(token) {
+    for (let i = 0; i < SEARCH_SUFFIXES.length; i++) {
+      const suf = SEARCH_SUFFIXES[i];
+      if (token.endsWith(suf) && token.length - suf.length >= 3) {
+        return token.slice(0, -suf.length);
+      }
+    }
+    return token;
+  }
+
+  function normalizeSearchTokens(text, stem) {
+    const words = String(text || "").toLowerCase().replace(/ё/g, "е").match(/[0-9a-zа-я]+/g) || [];
+    const out = [];
+    words.forEach(function (w) {
+      if (w.length < 2 || SEARCH_STOPWORDS.has(w)) return;
+      const tok = stem ? stemRu(w) : w;
+      if (out.indexOf(tok) === -1) out.push(tok);
+    });
+    return out;
+  }
+
+  // id событий, подходящих под запрос (все слова; последнее — как префикс, его ещё набирают).
+  // null — по индексу искать нечем или он ничего не нашёл, нужен обычный перебор подстрокой
+  function searchByIndex(query) {
+    if (!SEARCH_INDEX) return null;
+    const tokens = normalizeSearchTokens(query, SEARCH_INDEX.stem);
+    if (!tokens.length) return null;
+
+    const terms = SEARCH_INDEX.terms;
+    let result = null;
+    tokens.forEach(function (tok, i) {
+      const ids = new Set();
+      const add = function (list) {
+        list.forEach(function (id) {
+          ids.add(id);
+        });
+      };
+      if (i === tokens.length - 1) {
+        SEARCH_TERMS.forEach(function (term) {
+          if (term.startsWith(tok)) add(terms[term]);
+        });
+      } else if (terms[tok]) {
+        add(terms[tok]);
+      }
+      result = result
+        ? new Set(
+            Array.from(result).filter(function (id) {
+              return ids.has(id);
+            })
+          )
+        : ids;
+    });
+    return result && result.size ? result : null;
+  }
+
+  function matchesText(ev, q) {
+    const hay =
+      normalizeText(ev.title) +
+      " " +
+      normalizeText(ev.location) +
+      " " +
+      normalizeText(ev.raw_text);
+    return hay.includes(q);
+  }
+
   function applyFilters(allEvents) {
     const q = normalizeText(searchInput ? searchInput.value : "");
     const year = yearSelect ? String(yearSelect.value || "") : "";
     const status = statusSelect ? String(statusSelect.value || "") : "";
 
     const now = new Date();
+    let matchIds = null;
+    if (q) {
+      loadSearchIndex();
+      matchIds = searchByIndex(q);
+    }
 
     const filtered = allEvents.filter(function (ev) {
       if (year) {
@@ -253,14 +342,11 @@
         if (st !== status) return false;
       }
 
-      if (q) {
-        const hay =
-          normalizeText(ev.title) +
-          " " +
-          normalizeText(ev.location) +
-          " " +
-          normalizeText(ev.raw_text);
-        if (!hay.includes(q)) return false;
+      if (matchIds && SEARCH_INDEXED_IDS.has(ev.id)) {
+        if (!matchIds.has(ev.id)) return false;
+      } else if (q) {
+        // событий, которых нет в индексе (он из HTTP-кэша и старше выгрузки), — перебором
+        if (!matchesText(ev, q)) return false;
       }
 
       return true;
@@ -311,6 +397,38 @@
   let ALL_EVENTS = [];
   let GENERATED_AT = null;
   let debounceTimer = 0;
+  let SEARCH_INDEX = null;
+  let SEARCH_TERMS = [];
+  let SEARCH_INDEXED_IDS = new Set();
+  let searchIndexState = "idle";
+
+  // индекс грузится при первом поиске; пока его нет (или выгрузка без id) — обычный перебор
+  function loadSearchIndex() {
+    if (searchIndexState !== "idle") return;
+    if (!ALL_EVENTS.length || ALL_EVENTS[0].id == null) {
+      searchIndexState = "unavailable";
+      return;
+    }
+    searchIndexState = "loading";
+    fetchJson(INDEX_URL, "no-cache")
+      .then(function (index) {
+        if (index.version !== 1 || !index.terms) throw new Error("unsupported index");
+        const indexed = new Set();
+        Object.keys(index.terms).forEach(function (term) {
+          index.terms[term].forEach(function (id) {
+            indexed.add(id);
+          });
+        });
+        SEARCH_INDEX = index;
+        SEARCH_TERMS = Object.keys(index.terms);
+        SEARCH_INDEXED_IDS = indexed;
+        searchIndexState = "ready";
+        rerender();
+      })
+      .catch(function () {
+        searchIndexState = "unavailable";
+      });
+  }
 
   function rerender() {
     const filtered = applyFilters(ALL_EVENTS);
@@ -323,17 +441,66 @@
     debounceTimer = window.setTimeout(rerender, 160);
   }
 
+  // compact-формат (version 2): текст поста — один раз в payload.posts, событие ссылается на него по id;
+  // разворачиваем в поля полного формата, с которыми работает остальной код
+  function expandEvents(payload) {
+    const events = Array.isArray(payload.events) ? payload.events : [];
+    if (payload.format !== "compact") return events;
+
+    const posts = payload.posts || {};
+    return events.map(function (ev) {
+      const post = posts[String(ev.post)] || {};
+      return {
+        channel: payload.channel,
+        id: ev.id,
+        source_post_id: ev.post,
+        source_post_url: post.url || null,
+        published_at: post.published_at || null,
+        title: ev.title,
+        start_at: ev.start_at || null,
+        location: ev.location || null,
+        registration_url: ev.registration_url || null,
+        raw_text: post.text || post.preview || ""
+      };
+    });
+  }
+
+  async function fetchJson(url, cacheMode) {
+    const resp = await fetch(url, { cache: cacheMode });
+    if (!resp.ok) throw new Error("HTTP " + resp.status);
+    return resp.json();
+  }
+
+  // события из шардов по манифесту; null — манифеста нет или шард не загрузился
+  // (404 посреди деплоя, сеть), читаем единый файл
+  async function loadFromShards() {
+    let manifest;
+    let parts;
+    try {
+      manifest = await fetchJson(MANIFEST_URL, "no-cache");
+      const shards = Array.isArray(manifest.shards) ? manifest.shards : [];
+      parts = await Promise.all(
+        shards.map(function (sh) {
+          return fetchJson(SHARDS_BASE + sh.url, "default");
+        })
+      );
+    } catch (e) {
+      return null;
+    }
+    const events = [];
+    parts.forEach(function (part) {
+      events.push.apply(events, expandEvents(part));
+    });
+    return { events: events, generated_at: manifest.generated_at || null };
+  }
+
   async function load() {
     setError("");
     setLoading(true);
 
     try {
-      const resp = await fetch(DATA_URL, { cache: "no-store" });
-      if (!resp.ok) throw new Error("HTTP " + resp.status);
-
-      const payload = await resp.json();
-      const events = Array.isArray(payload.events) ? payload.events : [];
-      ALL_EVENTS = events;
+      const payload = (await loadFromShards()) || (await fetchJson(DATA_URL, "no-store"));
+      ALL_EVENTS = expandEvents(payload);
       GENERATED_AT = payload.generated_at || null;
 
       buildYearOptions(ALL_EVENTS);
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарки конвейера parser.py на сохранённых страницах из tools/fixtures
+(лента t.me/s/<channel> и страницы отдельных постов ?embed=1).
+
+  - эквивалентность: каждый HTML-бэкенд должен дать ровно те же TelegramPost, что и bs4;
+  - скорость по стадиям: parse_posts_from_html (по бэкендам), is_eventish_post,
+    extract_events_from_post, parse_ru_datetime_from_text, запись в SQLite (DbWriter)
+    и export_events_json;
+  - базовые замеры: --save сохраняет результаты в JSON, --compare сравнивает с ранее
+    сохранёнными (имеет смысл только на той же машине).
+
+Примеры:
+    python tools/bench_parser.py --repeat 20
+    python tools/bench_parser.py --save /tmp/bench-before.json
+    python tools/bench_parser.py --compare /tmp/bench-before.json --threshold 1.15
+Код возврата 1, если бэкенды разошлись хотя бы на одной странице
+или (с --compare) какая-то стадия замедлилась сильнее порога.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional
+
+import parser as tg
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+BASELINE_VERSION = 1
+
+
+def load_fixtures(pattern: str) -> Dict[str, str]:
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, pattern))):
+        # newline="": \r\n в фикстурах остаются как есть, как в ответе сервера
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+def available_backends() -> List[str]:
+    return [b for b in tg.HTML_BACKENDS if b != "auto" and tg.resolve_html_backend(b) == b]
+
+
+def check_equivalence(pages: Dict[str, str], channel: str) -> bool:
+    ok = True
+    for name, html in pages.items():
+        reference = tg.parse_posts_from_html(html, channel, backend="bs4")
+        for backend in available_backends():
+            got = tg.parse_posts_from_html(html, channel, backend=backend)
+            if got != reference:
+                ok = False
+                print(f"MISMATCH {backend} vs bs4: {name}")
+        print(f"checked {name}: {len(reference)} posts")
+    return ok
+
+
+def check_datetimes(pages: Dict[str, str], channel: str) -> bool:
+    """Дата, которую берёт parse_ru_datetime_from_text, должна быть среди всех дат find_ru_datetimes."""
+    ok = True
+    found = 0
+    for name, html in pages.items():
+        for p in tg.parse_posts_from_html(html, channel, backend="bs4"):
+            try:
+                first = tg.parse_ru_datetime_from_text(p.text, p.published_at)
+            except ValueError:
+                continue
+            every = [dt for _, dt in tg.find_ru_datetimes(p.text, p.published_at)]
+            found += len(every)
+            if first is not None and first not in every:
+                ok = False
+                print(f"MISMATCH find_ru_datetimes: {name} post {p.post_id}")
+    print(f"checked find_ru_datetimes: {found} dates")
+    return ok
+
+def scaled_posts(posts: List[tg.TelegramPost], scale: int) -> List[tg.TelegramPost]:
+    """Размножает посты фикстур с новыми post_id, чтобы у записи в БД и экспорта был заметный объём."""
+    out = []
+    step = max(p.post_id for p in posts) + 1
+    for k in range(scale):
+        for p in posts:
+            pid = p.post_id + k * step
+            out.append(replace(p, post_id=pid, post_url=f"https://t.me/{p.channel}/{pid}"))
+    return out
+
+
+def fill_db(conn: sqlite3.Connection, posts: List[tg.TelegramPost], batch_size: int = 200) -> int:
+    """Путь записи как в run_update_mode: пост + его события через DbWriter."""
+    writer = tg.DbWriter(conn, batch_size)
+    for p in posts:
+        keywords = tg.scan_keywords(p.text)
+        hints = tg.match_event_hints(p.text, keywords)
+        writer.add_post(p, hints)
+        if hints:
+            for ev in tg.extract_events_from_post(p, keywords):
+                writer.add_event(ev)
+        if writer.full:
+            writer.flush()
+    writer.flush()
+    return writer.inserted_posts
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Медиана и минимум по repeat прогонам fn (мс на прогон)."""
+    fn()  # прогрев: импорты, кэши regex, страницы SQLite
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "runs": repeat}
+
+
+def run_suite(pages: Dict[str, str], channel: str, repeat: int, scale: int) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+
+    def add(name: str, fn: Callable[[], object], items: int) -> None:
+        r = measure(fn, repeat)
+        r["items"] = items
+        results[name] = r
+        print(f"{name:<28} {r['median_ms']:9.3f} ms  (min {r['min_ms']:.3f}, {items} items)")
+
+    htmls = list(pages.values())
+    for backend in available_backends():
+        add(
+            f"parse_posts_html[{backend}]",
+            lambda b=backend: [tg.parse_posts_from_html(h, channel, backend=b) for h in htmls],
+            len(htmls),
+        )
+
+    posts = [p for h in htmls for p in tg.parse_posts_from_html(h, channel, backend="bs4")]
+    texts = [p.text for p in posts]
+    eventish = [p for p in posts if tg.is_eventish_post(p.text)]
+
+    add("is_eventish_post", lambda: [tg.is_eventish_post(t) for t in texts], len(texts))
+    add("extract_events_from_post", lambda: [tg.extract_events_from_post(p) for p in eventish], len(eventish))
+    add(
+        "parse_ru_datetime_from_text",
+        lambda: [tg.parse_ru_datetime_from_text(p.text, p.published_at) for p in posts],
+        len(posts),
+    )
+    add(
+        "find_ru_datetimes",
+        lambda: [tg.find_ru_datetimes(p.text, p.published_at) for p in posts],
+        len(posts),
+    )
+
+    bulk = scaled_posts(posts, scale)
+
+    def insert():
+        conn = sqlite3.connect(":memory:")
+        tg.db_init(conn)
+        fill_db(conn, bulk)
+        conn.close()
+
+    add("db_insert", insert, len(bulk))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "bench.sqlite"))
+        tg.db_init(conn)
+        fill_db(conn, bulk)
+        out_path = os.path.join(tmp, "events.json")
+        n_events = conn.execute("SELECT COUNT(*) FROM events WHERE channel=?", (channel,)).fetchone()[0]
+        add("export_events_json", lambda: tg.EventsExporter(conn, channel, out_path).export(force=True), n_events)
+        conn.close()
+
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_baseline(path: str, results: Dict[str, dict], args: argparse.Namespace) -> None:
+    payload = {
+        "version": BASELINE_VERSION,
+        "created_at": tg.now_iso(),
+        "commit": git_commit(),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "params": {"fixtures": args.fixtures, "repeat": args.repeat, "scale": args.scale},
+        "results": results,
+    }
+    tg.atomic_write_json(path, payload)
+    print(f"Baseline saved: {path}")
+
+
+def compare_baseline(path: str, results: Dict[str, dict], threshold: float) -> bool:
+    """Сравнивает медианы с сохранёнными. False, если какая-то стадия медленнее порога."""
+    with open(path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    if base.get("version") != BASELINE_VERSION:
+        print(f"Unsupported baseline version in {path}: {base.get('version')}")
+        return False
+
+    print(f"\nvs baseline {path} (commit {base.get('commit')}, {base.get('created_at')}):")
+    ok = True
+    for name, cur in results.items():
+        old = base.get("results", {}).get(name)
+        if not old:
+            print(f"{name:<28} new")
+            continue
+        ratio = cur["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+        mark = ""
+        if old.get("items") != cur.get("items"):
+            mark = "  (different input size)"
+        elif ratio > threshold:
+            mark = "  REGRESSION"
+            ok = False
+        print(f"{name:<28} {old['median_ms']:9.3f} -> {cur['median_ms']:9.3f} ms  x{ratio:.2f}{mark}")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Equivalence check and benchmark suite for parser.py")
+    ap.add_argument("--fixtures", default="*.html", help="glob по файлам в tools/fixtures")
+    ap.add_argument("--channel", default="bcmsu", help="канал, от имени которого разбираются страницы")
+    ap.add_argument("--repeat", type=int, default=10, help="сколько прогонов на каждую стадию")
+    ap.add_argument("--scale", type=int, default=50, help="во сколько раз размножить посты для записи в БД и экспорта")
+    ap.add_argument("--save", default=None, help="сохранить результаты как базовые в JSON")
+    ap.add_argument("--compare", default=None, help="сравнить с базовыми из JSON")
+    ap.add_argument("--threshold", type=float, default=1.2, help="во сколько раз медиана может вырасти без ошибки")
+    args = ap.parse_args()
+
+    pages = load_fixtures(args.fixtures)
+    if not pages:
+        print(f"No fixtures matching {args.fixtures} in {FIXTURES_DIR}")
+        sys.exit(2)
+
+    ok = check_equivalence(pages, args.channel)
+    ok = check_datetimes(pages, args.channel) and ok
+    print()
+
+    results = run_suite(pages, args.channel, max(1, args.repeat), max(1, args.scale))
+
+    if args.compare:
+        ok = compare_baseline(args.compare, results, args.threshold) and ok
+    if args.save:
+        save_baseline(args.save, results, args)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная замена t.me для нагрузочных тестов и проверки отказов parser.py без сети.
+
+Отдаёт синтетический канал из --posts постов в разметке t.me:
+  - /s/<channel>             — последние --page-size постов ленты;
+  - /s/<channel>?before=N    — --page-size постов с id < N (как пагинация t.me);
+  - /<channel>/<id>          — страница одного поста (удалённый пост — страница без сообщения);
+  - /__stats                 — счётчики ответов (JSON);
+  - /__faults?p429=0.2&...   — поменять параметры отказов на лету, без перезапуска.
+
+Отказы: 429 с Retry-After (случайно с вероятностью --p429 и/или при превышении --max-rps),
+5xx (--p5xx), медленные ответы (--latency-ms, --slow/--slow-ms), удалённые посты
+(--deleted, --deleted-ratio). Ответы поддерживают ETag/If-None-Match -> 304.
+
+Пример:
+    python tools/fake_telegram.py --port 8080 --posts 5000 --p429 0.05 --p5xx 0.02
+    python tools/parser.py --base-url http://127.0.0.1:8080 --channel demo --db /tmp/demo.sqlite --max-pages 50
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+FEED_RE = re.compile(r"^/s/(\w+)/?$")
+POST_RE = re.compile(r"^/(\w+)/(\d+)/?$")
+
+# от этого момента посты идут в прошлое через POST_INTERVAL
+NEWEST_POST_AT = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+POST_INTERVAL = timedelta(hours=7)
+
+RU_MONTHS_GEN = (
+    "января", "февраля", "марта", "апреля", "мая", "июня",
+    "июля", "августа", "сентября", "октября", "ноября", "декабря",
+)
+TOPICS = (
+    "Open talk с основателем стартапа", "Лекция о венчурных инвестициях", "Мастер-класс по питчингу",
+    "Воркшоп по финансовому моделированию", "Встреча с выпускниками", "Кейс-чемпионат",
+)
+PLACES = ("ауд. П6, Экономический факультет", "ШЭ МГУ, ауд. 203", "Шуваловский корпус, ауд. Г-1", "онлайн, Zoom")
+PLAIN = (
+    "Итоги недели в клубе: спасибо всем, кто пришёл!",
+    "Делимся фотографиями с прошедшей встречи.",
+    "Подборка статей о предпринимательстве на выходные.",
+)
+
+
+@dataclass
+class FakeConfig:
+    posts: int = 1000
+    page_size: int = 20
+    seed: int = 1
+    # удалённые посты: явные id и доля случайных
+    deleted: FrozenSet[int] = frozenset()
+    deleted_ratio: float = 0.0
+    # отказы
+    p429: float = 0.0
+    retry_after: int = 2
+    max_rps: float = 0.0  # 0 — без ограничения
+    p5xx: float = 0.0
+    latency_ms: int = 0
+    slow: float = 0.0
+    slow_ms: int = 3000
+
+
+class FakeTelegram:
+    """Состояние сервера: конфигурация, генерация страниц и счётчики. Потокобезопасно."""
+
+    def __init__(self, cfg: FakeConfig):
+        self.cfg = cfg
+        self._lock = threading.Lock()
+        self._rng = random.Random(cfg.seed)
+        self._window: List[float] = []  # время запросов за последнюю секунду (для --max-rps)
+        self.stats: Dict[str, int] = {}
+
+    # ---------- контент ----------
+
+    def is_deleted(self, pid: int) -> bool:
+        if pid in self.cfg.deleted:
+            return True
+        if self.cfg.deleted_ratio <= 0:
+            return False
+        # детерминированно по seed и id: одни и те же посты удалены при каждом запросе
+        return random.Random(self.cfg.seed * 1_000_003 + pid).random() < self.cfg.deleted_ratio
+
+    def published_at(self, pid: int) -> datetime:
+        return NEWEST_POST_AT - POST_INTERVAL * (self.cfg.posts - pid)
+
+    def post_content(self, channel: str, pid: int) -> Tuple[str, List[Tuple[str, str]]]:
+        """(html текста, [(href, anchor)]) — анонс, дайджест или обычный пост."""
+        rng = random.Random(self.cfg.seed * 7_919 + pid)
+        kind = rng.random()
+        if kind < 0.4:
+            when = self.published_at(pid) + timedelta(days=rng.randint(2, 20))
+            title = rng.choice(TOPICS)
+            lines = [
+                f"{title} #{pid}",
+                f"📅 {when.day} {RU_MONTHS_GEN[when.month - 1]}, {rng.randint(10, 20)}:{rng.choice(('00', '30'))}",
+                f"📍 Место: {rng.choice(PLACES)}",
+                "Регистрация по ссылке ниже",
+            ]
+            links = [(f"https://forms.example.org/event-{pid}", "Регистрация"), (f"https://t.me/s/{channel}?q=%23анонс", "#анонс")]
+        elif kind < 0.45:
+            lines = ["#дайджест", "Регистрация на события недели:"]
+            links = [(f"https://forms.example.org/d{pid}-{k}", f"{rng.choice(TOPICS)} ({k + 1})") for k in range(3)]
+        else:
+            lines = [rng.choice(PLAIN), f"Пост {pid}"]
+            links = []
+        text = "<br/>".join(html.escape(ln) for ln in lines)
+        text += "".join(f'<br/><a href="{html.escape(h)}">{html.escape(a)}</a>' for h, a in links)
+        return text, links
+
+    def message_html(self, channel: str, pid: int) -> str:
+        text, _ = self.post_content(channel, pid)
+        dt = self.published_at(pid)
+        return (
+            f'<div class="tgme_widget_message_wrap js-widget_message_wrap">'
+            f'<div class="tgme_widget_message text_not_supported_wrap js-widget_message" data-post="{channel}/{pid}" data-post-id="{pid}">'
+            f'<div class="tgme_widget_message_bubble">'
+            f'<div class="tgme_widget_message_text js-message_text" dir="auto">{text}</div>'
+            f'<div class="tgme_widget_message_footer compact js-message_footer"><div class="tgme_widget_message_info short js-message_info">'
+            f'<a class="tgme_widget_message_date" href="https://t.me/{channel}/{pid}">'
+            f'<time datetime="{dt.isoformat()}" class="time">{dt:%H:%M}</time></a>'
+            f'</div></div></div></div></div>\n'
+        )
+
+    def feed_ids(self, before: Optional[int]) -> List[int]:
+        top = self.cfg.posts if before is None else min(self.cfg.posts, before - 1)
+        ids: List[int] = []
+        pid = top
+        while pid >= 1 and len(ids) < self.cfg.page_size:
+            if not self.is_deleted(pid):
+                ids.append(pid)
+            pid -= 1
+        return sorted(ids)
+
+    def page(self, title: str, body: str) -> bytes:
+        return (
+            "<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+            f"<title>{html.escape(title)} &ndash; Telegram</title></head>\n"
+            f"<body class=\"widget_frame_base tgme_webpage_body\">\n<section class=\"tgme_channel_history js-message_history\">\n"
+            f"{body}</section>\n</body></html>\n"
+        ).encode("utf-8")
+
+    def render(self, path: str, query: Dict[str, List[str]]) -> Optional[bytes]:
+        m = FEED_RE.match(path)
+        if m:
+            before = query.get("before", [None])[0]
+            ids = self.feed_ids(int(before) if before and before.isdigit() else None)
+            body = "".join(self.message_html(m.group(1), pid) for pid in ids)
+            if ids and self.feed_ids(ids[0]):
+                # как на t.me: ссылка на более старые посты есть везде, кроме последней страницы
+                body = (
+                    f'<div class="tgme_widget_message_centered js-messages_more_wrap">'
+                    f'<a href="/s/{m.group(1)}?before={ids[0]}" class="tme_messages_more js-messages_more" '
+                    f'data-before="{ids[0]}"></a></div>\n'
+                ) + body
+            return self.page(m.group(1), body)
+        m = POST_RE.match(path)
+        if m:
+            channel, pid = m.group(1), int(m.group(2))
+            exists = 1 <= pid <= self.cfg.posts and not self.is_deleted(pid)
+            return self.page(channel, self.message_html(channel, pid) if exists else "")
+        return None
+
+    # ---------- отказы и счётчики ----------
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+
+    def fault(self) -> Tuple[Optional[int], float]:
+        """(код ошибки или None, задержка ответа в секундах) для очередного запроса."""
+        cfg = self.cfg
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            self._window.append(now)
+            over_rps = cfg.max_rps > 0 and len(self._window) > cfg.max_rps
+            r429, r5xx, rslow = self._rng.random(), self._rng.random(), self._rng.random()
+            code5 = self._rng.choice((500, 502, 503))
+
+        delay = cfg.latency_ms / 1000
+        if rslow < cfg.slow:
+            delay += cfg.slow_ms / 1000
+        if over_rps or r429 < cfg.p429:
+            return 429, delay
+        if r5xx < cfg.p5xx:
+            return code5, delay
+        return None, delay
+
+    def update(self, params: Dict[str, List[str]]) -> dict:
+        """
+        Применяет /__faults?name=value к конфигурации (поля FakeConfig, deleted — как --deleted).
+        ValueError — если значение не разбирается.
+        """
+        with self._lock:
+            for f in fields(self.cfg):
+                if f.name not in params:
+                    continue
+                value = params[f.name][0]
+                if f.name == "deleted":
+                    setattr(self.cfg, f.name, frozenset(parse_ids(value)))
+                else:
+                    setattr(self.cfg, f.name, type(getattr(self.cfg, f.name))(value))
+            cfg = asdict(self.cfg)
+        cfg["deleted"] = sorted(cfg["deleted"])
+        return cfg
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    server_version = "FakeTelegram/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего t.me
+
+    @property
+    def app(self) -> FakeTelegram:
+        return self.server.app  # type: ignore[attr-defined]
+
+    def log_message(self, fmt, *args):
+        logging.debug("%s %s", self.address_string(), fmt % args)
+
+    def send_body(self, code: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        u = urlsplit(self.path)
+        query = parse_qs(u.query)
+
+        if u.path == "/__stats":
+            return self.send_body(200, json.dumps(self.app.stats).encode(), "application/json")
+        if u.path == "/__faults":
+            try:
+                cfg = self.app.update(query)
+            except ValueError as e:
+                return self.send_body(400, str(e).encode(), "text/plain")
+            return self.send_body(200, json.dumps(cfg).encode(), "application/json")
+
+        app = self.app
+        app.count("requests")
+        code, delay = app.fault()
+        if delay > 0:
+            time.sleep(delay)
+        if code == 429:
+            app.count("429")
+            return self.send_body(429, b"Too Many Requests", "text/plain",
+                                  {"Retry-After": str(app.cfg.retry_after)})
+        if code is not None:
+            app.count("5xx")
+            return self.send_body(code, b"Server Error", "text/plain")
+
+        body = app.render(u.path, query)
+        if body is None:
+            app.count("404")
+            return self.send_body(404, b"Not Found", "text/plain")
+
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        headers = {"ETag": etag, "Last-Modified": format_datetime(NEWEST_POST_AT, usegmt=True)}
+        if self.headers.get("If-None-Match") == etag:
+            app.count("304")
+            self.send_response(304)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            return
+        app.count("200")
+        app.count("bytes", len(body))
+        self.send_body(200, body, "text/html; charset=utf-8", headers)
+
+    do_HEAD = do_GET
+
+
+def make_server(cfg: FakeConfig, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    """Сервер без запуска: serve_forever() — в своём потоке (например, из скрипта нагрузочного теста)."""
+    srv = ThreadingHTTPServer((host, port), FakeTelegramHandler)
+    srv.daemon_threads = True
+    srv.app = FakeTelegram(cfg)  # type: ignore[attr-defined]
+    return srv
+
+
+def parse_ids(s: str) -> Set[int]:
+    """"50,51,100-120" -> {50, 51, 100..120}."""
+    out: Set[int] = set()
+    for part in s.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = part.split("-", 1)
+            out.update(range(int(a), int(b) + 1))
+        else:
+            out.add(int(part))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local stand-in for t.me public channel pages with fault injection")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--posts", type=int, default=1000, help="сколько постов в канале (id 1..N)")
+    ap.add_argument("--page-size", type=int, default=20, help="постов на странице ленты")
+    ap.add_argument("--seed", type=int, default=1, help="seed генерации текстов и отказов")
+    ap.add_argument("--deleted", default="", help="удалённые id, например: 50,51,100-120")
+    ap.add_argument("--deleted-ratio", type=float, default=0.0, help="доля случайно удалённых постов")
+    ap.add_argument("--p429", type=float, default=0.0, help="вероятность ответа 429")
+    ap.add_argument("--retry-after", type=int, default=2, help="Retry-After (сек) в ответах 429")
+    ap.add_argument("--max-rps", type=float, default=0.0, help="больше стольких запросов в секунду — 429 (0 — без лимита)")
+    ap.add_argument("--p5xx", type=float, default=0.0, help="вероятность ответа 500/502/503")
+    ap.add_argument("--latency-ms", type=int, default=0, help="задержка каждого ответа (мс)")
+    ap.add_argument("--slow", type=float, default=0.0, help="вероятность медленного ответа")
+    ap.add_argument("--slow-ms", type=int, default=3000, help="доп. задержка медленного ответа (мс)")
+    ap.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = ap.parse_args()
+
+    logging.basicConfig(level=getattr(logging, args.log_level), format="%(asctime)s | %(levelname)s | %(message)s")
+
+    cfg = FakeConfig(
+        posts=args.posts,
+        page_size=args.page_size,
+        seed=args.seed,
+        deleted=frozenset(parse_ids(args.deleted)),
+        deleted_ratio=args.deleted_ratio,
+        p429=args.p429,
+        retry_after=args.retry_after,
+        max_rps=args.max_rps,
+        p5xx=args.p5xx,
+        latency_ms=args.latency_ms,
+        slow=args.slow,
+        slow_ms=args.slow_ms,
+    )
+    srv = make_server(cfg, args.host, args.port)
+    logging.info("Serving fake t.me on http://%s:%d (%d posts)", args.host, args.port, cfg.posts)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        logging.info("Stats: %s", json.dumps(srv.app.stats))  # type: ignore[attr-defined]
+
+
+if __name__ == "__main__":
+    main()
@@ -2,22 +2,50 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import asyncio
+import bisect
+import cProfile
+import gzip
 import hashlib
+import itertools
 import json
 import logging
 import os
 import random
 import re
+import signal
 import sqlite3
 import sys
+import threading
 import time
-from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, replace
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
 from zoneinfo import ZoneInfo
 
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:  # lxml необязателен: без него работает бэкенд bs4
+    lxml = None
+
+try:
+    import brotli
+except ImportError:  # без brotli предсжатие только в .gz
+    brotli = None
+
+try:
+    import resource
+except ImportError:  # нет на Windows: пиковая память в сводке не показывается
+    resource = None
 
 
 MOSCOW_TZ = ZoneInfo("Europe/Moscow")
@@ -32,11 +60,14 @@ EVENT_HINT_WORDS = (
     "регистрация", "дата", "время", "место", "встреча", "лекция",
     "мастер-класс", "воркшоп", "open talk", "ивент", "событ"
 )
+# дайджест = все маркеры сразу (+ минимум две ссылки)
+DIGEST_MARKERS = ("регистрация на события", "#дайджест")
 
 
 # ---------- модели ----------
 
-@dataclass
+# slots: без __dict__ у каждого экземпляра — заметно при догрузке истории и переразборе
+@dataclass(slots=True)
 class TelegramPost:
     channel: str
     post_id: int
@@ -47,7 +78,7 @@ class TelegramPost:
     links: List[Tuple[str, str]]
 
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     channel: str
     source_post_id: int
@@ -74,21 +105,91 @@ def clean_text(s: str) -> str:
 def sha1(s: str) -> str:
     return hashlib.sha1(s.encode("utf-8", errors="ignore")).hexdigest()
 
-def atomic_write_json(path: str, payload: dict) -> None:
+def atomic_write_json(path: str, payload: dict, minify: bool = False) -> None:
     tmp = f"{path}.tmp"
     with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+        if minify:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+        else:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
         f.flush()
         os.fsync(f.fileno())
     os.replace(tmp, path)
 
+def _trie_pattern(node: dict) -> str:
+    # префиксное дерево -> регулярное выражение; "" в узле — здесь кончается слово
+    alts = [re.escape(ch) + _trie_pattern(sub) for ch, sub in sorted(node.items()) if ch]
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    # жадный "?": с одной позиции берётся самое длинное слово
+    return f"(?:{body})?" if "" in node else body
+
+class KeywordMatcher:
+    """
+    Все ключевые слова из текста одним скомпилированным регулярным выражением. Слова
+    собраны в префиксное дерево, поэтому на каждой позиции re проверяет один символ,
+    а не весь список. Поиск перезапускается со следующей позиции после начала совпадения
+    (перекрывающиеся вхождения не теряются); слова, вложенные в найденное ("#ивенты" даёт
+    и "ивент"), добавляются по заранее посчитанной таблице.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: Tuple[str, ...] = tuple(dict.fromkeys(k.lower() for k in keywords if k))
+        trie: dict = {}
+        for kw in self.keywords:
+            node = trie
+            for ch in kw:
+                node = node.setdefault(ch, {})
+            node[""] = {}
+        self._re = re.compile(_trie_pattern(trie)) if self.keywords else None
+        self._nested = {kw: tuple(k for k in self.keywords if k in kw) for kw in self.keywords}
+
+    def find_all(self, text: str) -> set:
+        """Множество ключевых слов, встретившихся в тексте (без учёта регистра)."""
+        found: set = set()
+        if self._re is None:
+            return found
+        low = (text or "").lower()
+        search, nested = self._re.search, self._nested
+        m = search(low)
+        while m:
+            found.update(nested[m.group()])
+            m = search(low, m.start() + 1)
+        return found
+
+
+_event_hints: Tuple[str, ...] = EVENT_HINT_HASHTAGS + EVENT_HINT_WORDS
+_keyword_matcher = KeywordMatcher(_event_hints + DIGEST_MARKERS)
+
+def set_extra_event_hints(words: Iterable[str]) -> int:
+    """Добавляет к стандартным подсказкам слова канала. Возвращает итоговое число подсказок."""
+    global _event_hints, _keyword_matcher
+    _event_hints = tuple(dict.fromkeys(EVENT_HINT_HASHTAGS + EVENT_HINT_WORDS + tuple(w.lower() for w in words if w)))
+    _keyword_matcher = KeywordMatcher(_event_hints + DIGEST_MARKERS)
+    return len(_event_hints)
+
+def load_event_hints(path: str) -> List[str]:
+    # одно слово/фраза на строку; "# " (решётка и пробел) — комментарий, хэштеги пишутся слитно: #анонс
+    words = []
+    with open(path, "r", encoding="utf-8") as f:
+        for ln in f:
+            ln = ln.strip()
+            if ln and not ln.startswith("# "):
+                words.append(ln)
+    return words
+
+def scan_keywords(text: str) -> set:
+    """Все подсказки и маркеры дайджеста из текста — одним проходом."""
+    return _keyword_matcher.find_all(text)
+
+def match_event_hints(text: str, keywords: Optional[set] = None) -> List[str]:
+    """Какие подсказки "это анонс" нашлись в тексте (в порядке списка подсказок)."""
+    found = scan_keywords(text) if keywords is None else keywords
+    return [h for h in _event_hints if h in found]
+
 def is_eventish_post(text: str) -> bool:
-    low = (text or "").lower()
-    if any(tag in low for tag in EVENT_HINT_HASHTAGS):
-        return True
-    if any(w in low for w in EVENT_HINT_WORDS):
-        return True
-    return False
+    return bool(match_event_hints(text))
 
 def pick_title(text: str) -> str:
     lines = [ln.strip() for ln in (text or "").splitlines() if ln.strip()]
@@ -109,62 +210,117 @@ def choose_registration_url(links: List[Tuple[str, str]]) -> Optional[str]:
         return href
     return links[0][0] if links else None
 
+class DateCandidate(NamedTuple):
+    kind: str               # "full" (dd.mm.yyyy) | "short" (dd.mm) | "month" (4 декабря) | "time" (18:30)
+    start: int              # позиции в тексте (после lower())
+    end: int
+    day: Optional[int]
+    month: Optional[int]
+    year: Optional[int]     # только если указан в тексте
+    hour: Optional[int]
+    minute: Optional[int]
+
+# Все виды дат и время — одна скомпилированная регулярка с общим началом "1-2 цифры",
+# поэтому движок быстро проматывает текст до ближайшей цифры. Ветки взаимоисключающие
+# (после числа идёт либо [./], либо пробел+месяц, либо ":"), так что у позиции не больше
+# одного вида, кроме пары full/short, где full и так приоритетнее.
+_DATETIME_SCAN_RE = re.compile(
+    r"(?P<d>\d\d?)(?:"
+    r"(?P<full>[./](?P<fm>\d{1,2})[./](?P<fy>\d{2,4}))"
+    r"|(?P<short>[./](?P<sm>\d{1,2})(?![./]\d))"
+    r"|(?P<month>\s+(?P<mn>" + "|".join(RU_MONTHS) + r")(?:\s+(?P<my>\d{4}))?)"
+    r"|(?P<time>:(?P<mi>\d{2}))"
+    r")"
+)
+
+# в каком окне после даты искать время
+_TIME_WINDOW = {"full": 80, "short": 80, "month": 100}
+
+def scan_datetime_candidates(text: str) -> List[DateCandidate]:
+    """
+    Один проход по тексту: все кандидаты дат и времени с позициями, в порядке появления.
+    Поиск продолжается со следующего символа после начала совпадения, поэтому кандидаты
+    могут перекрываться ("09.12.2025" — это и full, и full "9.12.2025") — ровно как
+    при отдельных re.search по каждому шаблону.
+    """
+    out: List[DateCandidate] = []
+    search = _DATETIME_SCAN_RE.search
+    pos = 0
+    while True:
+        m = search(text, pos)
+        if m is None:
+            return out
+        pos = m.start() + 1
+        d = int(m.group("d"))
+        kind = m.lastgroup
+        if kind == "full":
+            y = int(m.group("fy"))
+            out.append(DateCandidate("full", m.start(), m.end(), d, int(m.group("fm")), y + 2000 if y < 100 else y, None, None))
+        elif kind == "short":
+            out.append(DateCandidate("short", m.start(), m.end(), d, int(m.group("sm")), None, None, None))
+        elif kind == "month":
+            my = m.group("my")
+            out.append(DateCandidate("month", m.start(), m.end(), d, RU_MONTHS[m.group("mn")], int(my) if my else None, None, None))
+        else:
+            out.append(DateCandidate("time", m.start(), m.end(), None, None, None, d, int(m.group("mi"))))
+
+def _time_after(c: DateCandidate, times: List[DateCandidate], starts: List[int]) -> Tuple[int, int]:
+    # первое время, целиком лежащее в окне после даты
+    limit = c.end + _TIME_WINDOW[c.kind]
+    i = bisect.bisect_left(starts, c.end)
+    if i < len(times) and times[i].end <= limit:
+        return times[i].hour, times[i].minute
+    return 0, 0
+
+def _candidate_datetime(c: DateCandidate, times: List[DateCandidate], starts: List[int], base: datetime) -> datetime:
+    """Дата кандидата + время после неё. ValueError, если такой даты не бывает."""
+    hh, mm = _time_after(c, times, starts)
+    y = c.year if c.year is not None else base.year
+    candidate = datetime(y, c.month, c.day, hh, mm, tzinfo=MOSCOW_TZ)
+    # без года и уже в прошлом (с запасом в неделю) — значит, следующий год
+    if c.year is None and candidate < (base - timedelta(days=7)):
+        candidate = datetime(y + 1, c.month, c.day, hh, mm, tzinfo=MOSCOW_TZ)
+    return candidate
+
+def _split_candidates(cands: List[DateCandidate]) -> Tuple[List[DateCandidate], List[DateCandidate], List[int]]:
+    dates = [c for c in cands if c.kind != "time"]
+    times = [c for c in cands if c.kind == "time"]
+    return dates, times, [t.start for t in times]
+
+def find_ru_datetimes(text: str, base: Optional[datetime]) -> List[Tuple[DateCandidate, datetime]]:
+    """
+    Все даты из текста с позициями: неперекрывающиеся кандидаты слева направо,
+    каждая со своим временем (если оно есть рядом). Несуществующие даты пропускаются.
+    """
+    base = base or datetime.now(tz=MOSCOW_TZ)
+    dates, times, starts = _split_candidates(scan_datetime_candidates((text or "").lower()))
+    out = []
+    last_end = -1
+    for c in dates:
+        if c.start < last_end:
+            continue
+        try:
+            out.append((c, _candidate_datetime(c, times, starts, base)))
+        except ValueError:
+            continue
+        last_end = c.end
+    return out
+
 def parse_ru_datetime_from_text(text: str, base: Optional[datetime]) -> Optional[datetime]:
     """
     Best-effort: выдёргиваем первую встреченную дату/время из текста.
-    Поддерживает:
+    Поддерживает (в порядке приоритета):
       - 09.12.2025 ... 18:30
       - 09.12 ... 18:30
       - 4 декабря, 18:00 (+ год опционально)
     Если год не указан — base.year (или текущий).
     """
     base = base or datetime.now(tz=MOSCOW_TZ)
-    low = (text or "").lower()
-
-    # dd.mm.yyyy
-    m = re.search(r"(\d{1,2})[./](\d{1,2})[./](\d{2,4})", low)
-    if m:
-        d, mo, y = int(m.group(1)), int(m.group(2)), int(m.group(3))
-        if y < 100:
-            y += 2000
-        hh, mm = 0, 0
-        tm = re.search(r"(\d{1,2}):(\d{2})", low[m.end(): m.end() + 80])
-        if tm:
-            hh, mm = int(tm.group(1)), int(tm.group(2))
-        return datetime(y, mo, d, hh, mm, tzinfo=MOSCOW_TZ)
-
-    # dd.mm (без года)
-    m = re.search(r"(\d{1,2})[./](\d{1,2})(?![./]\d)", low)
-    if m:
-        d, mo = int(m.group(1)), int(m.group(2))
-        y = base.year
-        hh, mm = 0, 0
-        tm = re.search(r"(\d{1,2}):(\d{2})", low[m.end(): m.end() + 80])
-        if tm:
-            hh, mm = int(tm.group(1)), int(tm.group(2))
-        candidate = datetime(y, mo, d, hh, mm, tzinfo=MOSCOW_TZ)
-        if candidate < (base - timedelta(days=7)):
-            candidate = datetime(y + 1, mo, d, hh, mm, tzinfo=MOSCOW_TZ)
-        return candidate
-
-    # "4 декабря (2025) ... 18:00"
-    m = re.search(
-        r"(\d{1,2})\s+(января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)(?:\s+(\d{4}))?",
-        low,
-    )
-    if m:
-        d = int(m.group(1))
-        mo = RU_MONTHS.get(m.group(2), 0)
-        y = int(m.group(3)) if m.group(3) else base.year
-        hh, mm = 0, 0
-        tm = re.search(r"(\d{1,2}):(\d{2})", low[m.end(): m.end() + 100])
-        if tm:
-            hh, mm = int(tm.group(1)), int(tm.group(2))
-        candidate = datetime(y, mo, d, hh, mm, tzinfo=MOSCOW_TZ)
-        if not m.group(3) and candidate < (base - timedelta(days=7)):
-            candidate = datetime(y + 1, mo, d, hh, mm, tzinfo=MOSCOW_TZ)
-        return candidate
-
+    dates, times, starts = _split_candidates(scan_datetime_candidates((text or "").lower()))
+    for kind in ("full", "short", "month"):
+        for c in dates:
+            if c.kind == kind:
+                return _candidate_datetime(c, times, starts, base)
     return None
 
 def event_key(e: Event) -> str:
@@ -172,8 +328,170 @@ def event_key(e: Event) -> str:
     return sha1(base)
 
 
+# ---------- замеры по стадиям ----------
+
+class RunStats:
+    """
+    Таймеры и счётчики запуска. stage(name) копит wall/CPU-время и число вызовов,
+    count(name, n) — счётчики (страницы, байты, ретраи, сон...). Потокобезопасен:
+    сеть в --async идёт из потоков движка, поэтому wall стадий может в сумме
+    превышать длительность запуска. CPU — время текущего потока (thread_time).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {}  # name -> [wall_s, cpu_s, calls]
+        self.counters: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        w0, c0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            dw, dc = time.perf_counter() - w0, time.thread_time() - c0
+            with self._lock:
+                st = self.stages.setdefault(name, [0.0, 0.0, 0])
+                st[0] += dw
+                st[1] += dc
+                st[2] += 1
+
+    def count(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "elapsed_s": round(time.perf_counter() - self.started, 3),
+                "cpu_s": round(time.process_time(), 3),
+                "peak_rss_mb": peak_rss_mb(),
+                "stages": {
+                    name: {"wall_s": round(w, 3), "cpu_s": round(c, 3), "calls": n}
+                    for name, (w, c, n) in sorted(self.stages.items(), key=lambda kv: -kv[1][0])
+                },
+                "counters": {k: round(v, 3) if isinstance(v, float) else v for k, v in sorted(self.counters.items())},
+            }
+
+    def report(self) -> str:
+        s = self.summary()
+        head = f"elapsed {s['elapsed_s']:.2f}s, cpu {s['cpu_s']:.2f}s"
+        if s["peak_rss_mb"] is not None:
+            head += f", peak RSS {s['peak_rss_mb']:.1f} MB"
+        lines = [head]
+        for name, st in s["stages"].items():
+            lines.append(f"  {name:<10} wall {st['wall_s']:8.3f}s  cpu {st['cpu_s']:8.3f}s  calls {st['calls']}")
+        if s["counters"]:
+            lines.append("  " + ", ".join(f"{k}={v}" for k, v in s["counters"].items()))
+        return "\n".join(lines)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Пиковый RSS в МБ: максимум по процессу и самому большому из завершившихся дочерних
+    (пул --reextract). None — нет модуля resource.
+    """
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss: Linux — КБ, macOS — байты
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+STATS = RunStats()
+
+def pause(seconds: float) -> None:
+    """time.sleep с учётом в STATS (sleep_s)."""
+    if seconds > 0:
+        STATS.count("sleep_s", seconds)
+        time.sleep(seconds)
+
+def write_checkpoint_stats(path: str) -> None:
+    """Дописывает сводку STATS в checkpoint.json, не трогая остальные поля."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        payload = {}
+    payload["stats"] = STATS.summary()
+    atomic_write_json(path, payload)
+
+
 # ---------- сеть (ретраи/429/бэкофф) ----------
 
+class AdaptiveRateController:
+    """
+    Общий на запуск темп запросов по хостам (AIMD): каждый нормальный ответ
+    прибавляет `increase` запросов/с (до max_rate), 429/5xx/сетевая ошибка
+    делят темп на 2 (не чаще раза за паузу) и ставят паузу для хоста —
+    Retry-After или экспоненциальный бэкофф. Потокобезопасный: reserve() раздаёт
+    слоты по очереди, как HostRateLimiter, но интервал берётся из текущего темпа.
+    """
+
+    def __init__(
+        self,
+        initial_rate: float,
+        min_rate: float = 0.05,
+        max_rate: float = 2.0,
+        increase: float = 0.05,
+        decrease: float = 0.5,
+    ):
+        self.min_rate = min_rate
+        self.max_rate = max(min_rate, max_rate)
+        self.initial_rate = self._clamp(initial_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self._rate: Dict[str, float] = {}
+        self._next_at: Dict[str, float] = {}
+        self._calm_at: Dict[str, float] = {}  # до этого момента повторно темп не снижаем
+        self._lock = threading.Lock()
+
+    def _clamp(self, rate: float) -> float:
+        return min(self.max_rate, max(self.min_rate, rate))
+
+    def set_rate(self, host: str, rate: float) -> None:
+        with self._lock:
+            self._rate[host] = self._clamp(rate)
+
+    def rates(self) -> Dict[str, float]:
+        with self._lock:
+            return {h: round(r, 4) for h, r in self._rate.items()}
+
+    def reserve(self, url: str) -> float:
+        """Занимает ближайший слот для хоста url и возвращает, сколько секунд до него ждать."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            rate = self._rate.setdefault(host, self.initial_rate)
+            slot = max(now, self._next_at.get(host, 0.0))
+            self._next_at[host] = slot + 1.0 / rate
+        return slot - now
+
+    def on_success(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        with self._lock:
+            rate = self._rate.get(host, self.initial_rate)
+            self._rate[host] = min(self.max_rate, rate + self.increase)
+
+    def on_throttle(self, url: str, delay: float) -> None:
+        """429/5xx/сетевая ошибка: следующий запрос к хосту — не раньше чем через delay секунд."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._calm_at.get(host, 0.0):
+                rate = self._rate.get(host, self.initial_rate)
+                self._rate[host] = max(self.min_rate, rate * self.decrease)
+                logging.info("Rate for %s lowered to %.2f req/s", host, self._rate[host])
+            resume = now + delay
+            self._next_at[host] = max(self._next_at.get(host, 0.0), resume)
+            self._calm_at[host] = resume
+        STATS.count("throttled")
+
+
 def get_with_retries(
     session: requests.Session,
     url: str,
@@ -181,12 +499,23 @@ def get_with_retries(
     max_tries: int = 6,
     base_sleep: float = 1.0,
     max_sleep: float = 60.0,
+    headers: Optional[Dict[str, str]] = None,
 ) -> requests.Response:
     last_exc: Optional[Exception] = None
+    # с контроллером паузы — это его слоты; без него — фиксированный --sleep снаружи и сон здесь
+    ctl: Optional[AdaptiveRateController] = getattr(session, "rate_controller", None)
+    backoff = ctl.on_throttle if ctl else (lambda _url, s: pause(s))
 
     for attempt in range(1, max_tries + 1):
+        if attempt > 1:
+            STATS.count("retries")
+        if ctl:
+            pause(ctl.reserve(url))
         try:
-            resp = session.get(url, timeout=timeout)
+            with STATS.stage("network"):
+                resp = session.get(url, timeout=timeout, headers=headers)
+            STATS.count("requests")
+            STATS.count("bytes", len(resp.content))
             # 429 — слишком часто
             if resp.status_code == 429:
                 ra = resp.headers.get("Retry-After")
@@ -196,7 +525,7 @@ def get_with_retries(
                     sleep_s = min(max_sleep, base_sleep * (2 ** (attempt - 1)))
                 sleep_s *= (0.85 + random.random() * 0.4)  # jitter
                 logging.warning("429 Too Many Requests: sleep %.1fs url=%s", sleep_s, url)
-                time.sleep(sleep_s)
+                backoff(url, sleep_s)
                 continue
 
             # временные серверные
@@ -204,9 +533,11 @@ def get_with_retries(
                 sleep_s = min(max_sleep, base_sleep * (2 ** (attempt - 1)))
                 sleep_s *= (0.85 + random.random() * 0.4)
                 logging.warning("HTTP %s: retry in %.1fs url=%s", resp.status_code, sleep_s, url)
-                time.sleep(sleep_s)
+                backoff(url, sleep_s)
                 continue
 
+            if ctl:
+                ctl.on_success(url)
             resp.raise_for_status()
             return resp
 
@@ -215,7 +546,7 @@ def get_with_retries(
             sleep_s = min(max_sleep, base_sleep * (2 ** (attempt - 1)))
             sleep_s *= (0.85 + random.random() * 0.4)
             logging.warning("Network error: %s | retry in %.1fs url=%s", e, sleep_s, url)
-            time.sleep(sleep_s)
+            backoff(url, sleep_s)
             continue
         except requests.HTTPError as e:
             # 404/403 и т.п. — обычно не лечится ретраями
@@ -227,13 +558,135 @@ def get_with_retries(
 
 # ---------- парсинг HTML ----------
 
-def parse_posts_from_html(html: str, channel: str) -> List[TelegramPost]:
+# Бэкенды разбора страниц. Оба отдают одинаковые "сырые" сообщения:
+# (data-post, time@datetime, текст через "\n" или None, [(href, anchor)]),
+# дальше общая сборка TelegramPost — поэтому результат не зависит от бэкенда.
+HTML_BACKENDS = ("auto", "lxml", "bs4")
+
+_html_backend = "bs4"
+
+RawMessage = Tuple[Optional[str], Optional[str], Optional[str], List[Tuple[str, str]]]
+
+def resolve_html_backend(name: str) -> str:
+    if name == "auto":
+        return "lxml" if lxml is not None else "bs4"
+    if name == "lxml" and lxml is None:
+        logging.warning("lxml is not installed, falling back to bs4 HTML backend")
+        return "bs4"
+    return name
+
+def set_html_backend(name: str) -> str:
+    global _html_backend
+    _html_backend = resolve_html_backend(name)
+    return _html_backend
+
+def _raw_messages_bs4(html: str) -> Iterator[RawMessage]:
     soup = BeautifulSoup(html, "html.parser")
-    posts: List[TelegramPost] = []
 
     # Более устойчиво: div.tgme_widget_message[data-post="channel/123"]
     for msg in soup.select("div.tgme_widget_message"):
-        data_post = msg.get("data-post")
+        time_tag = msg.select_one("a.tgme_widget_message_date time")
+        text_div = msg.select_one("div.tgme_widget_message_text")
+        links: List[Tuple[str, str]] = []
+        if text_div:
+            for a in text_div.select("a[href]"):
+                links.append((a.get("href") or "", a.get_text(" ", strip=True)))
+        yield (
+            msg.get("data-post"),
+            time_tag.get("datetime") if time_tag else None,
+            text_div.get_text("\n") if text_div else None,
+            links,
+        )
+        # в кортеже только str; дерево bs4 циклическое — без decompose() его освободит лишь сборщик мусора
+        msg.decompose()
+    soup.decompose()
+
+def _xpath_class(cls: str) -> str:
+    # аналог CSS-селектора .cls: совпадение по одному из классов
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')"
+
+if lxml is not None:
+    _XP_MESSAGES = lxml.etree.XPath(f"//div[{_xpath_class('tgme_widget_message')}]")
+    _XP_TIME = lxml.etree.XPath(f"(.//a[{_xpath_class('tgme_widget_message_date')}]//time)[1]")
+    _XP_TEXT = lxml.etree.XPath(f"(.//div[{_xpath_class('tgme_widget_message_text')}])[1]")
+    _XP_LINKS = lxml.etree.XPath(".//a[@href]")
+
+# bs4.get_text() не берёт текст этих элементов, а itertext() — берёт
+_LXML_HIDDEN_TAGS = ("script", "style", "template")
+# внутри них html.parser в bs4 оставляет пробельные строки как есть
+_LXML_PRESERVE_TAGS = ("pre", "textarea")
+_BS4_SPACES = " \n\t\f\r"
+
+def _bs4_string(s: str) -> str:
+    # html.parser в bs4 сводит строку из одних ASCII-пробелов к "\n" (если в ней был перевод строки) или " "
+    if s.strip(_BS4_SPACES):
+        return s
+    return "\n" if "\n" in s else " "
+
+def _message_text_lxml(el, preserve: bool = False) -> Iterator[str]:
+    """
+    Строки текста как в bs4.get_text(): без <script>/<style>/<template>, хвосты — отдельно,
+    пробельные строки вне <pre>/<textarea> — одним пробелом или переводом строки.
+    """
+    if next(el.iter(*_LXML_HIDDEN_TAGS, *_LXML_PRESERVE_TAGS), None) is None:
+        for t in el.itertext():
+            yield t if preserve else _bs4_string(t)
+        return
+    preserve = preserve or el.tag in _LXML_PRESERVE_TAGS
+    if el.text:
+        yield el.text if preserve else _bs4_string(el.text)
+    for child in el:
+        # у комментариев tag — не строка; bs4 их текст тоже пропускает
+        if isinstance(child.tag, str) and child.tag not in _LXML_HIDDEN_TAGS:
+            yield from _message_text_lxml(child, preserve)
+        if child.tail:
+            # хвост — уже снаружи child, как у родителя
+            yield child.tail if preserve else _bs4_string(child.tail)
+
+def _raw_messages_lxml(html: str) -> Iterator[RawMessage]:
+    if not html.strip():
+        return
+    try:
+        root = lxml.html.document_fromstring(
+            html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8")
+        )
+    except lxml.etree.ParserError:
+        return
+
+    for msg in _XP_MESSAGES(root):
+        time_tag = _XP_TIME(msg)
+        text_div = _XP_TEXT(msg)
+        links: List[Tuple[str, str]] = []
+        if text_div:
+            for a in _XP_LINKS(text_div[0]):
+                # как get_text(" ", strip=True) в bs4
+                anchor = " ".join(t.strip() for t in _message_text_lxml(a) if t.strip())
+                links.append((a.get("href"), anchor))
+        yield (
+            msg.get("data-post"),
+            time_tag[0].get("datetime") if time_tag else None,
+            "\n".join(_message_text_lxml(text_div[0])) if text_div else None,
+            links,
+        )
+        # разобранное сообщение больше не нужно — освобождаем поддерево, не дожидаясь конца страницы
+        msg.clear()
+
+# ссылка "загрузить ещё" вниз по ленте; на странице с первым постом канала её нет
+FEED_OLDER_RE = re.compile(r'tme_messages_more[^>]*data-before="\d+"')
+
+def feed_has_older(html: str) -> bool:
+    return FEED_OLDER_RE.search(html) is not None
+
+def parse_posts_from_html(html: str, channel: str, backend: Optional[str] = None) -> List[TelegramPost]:
+    backend = resolve_html_backend(backend) if backend else _html_backend
+    # переводы строк как в браузере (и в libxml2, который иначе не умеет): \r\n и \r -> \n,
+    # иначе bs4 оставил бы \r в тексте и бэкенды разошлись бы по text_hash
+    if "\r" in html:
+        html = html.replace("\r\n", "\n").replace("\r", "\n")
+    raw_messages = _raw_messages_lxml(html) if backend == "lxml" else _raw_messages_bs4(html)
+    posts: List[TelegramPost] = []
+
+    for data_post, dt_attr, raw_text, raw_links in raw_messages:
         if not data_post or "/" not in data_post:
             continue
         try:
@@ -244,25 +697,21 @@ def parse_posts_from_html(html: str, channel: str) -> List[TelegramPost]:
         post_url = f"https://t.me/{data_post}"
 
         published_at = None
-        time_tag = msg.select_one("a.tgme_widget_message_date time")
-        if time_tag and time_tag.get("datetime"):
-            dt_raw = time_tag["datetime"].replace("Z", "+00:00")
+        if dt_attr:
+            dt_raw = dt_attr.replace("Z", "+00:00")
             try:
                 published_at = datetime.fromisoformat(dt_raw)
             except Exception:
                 published_at = None
 
-        text_div = msg.select_one("div.tgme_widget_message_text")
-        text = clean_text(text_div.get_text("\n") if text_div else "")
+        text = clean_text(raw_text or "")
 
         links: List[Tuple[str, str]] = []
-        if text_div:
-            for a in text_div.select("a[href]"):
-                href = (a.get("href") or "").strip()
-                if not href:
-                    continue
-                anchor = clean_text(a.get_text(" ", strip=True)) or href
-                links.append((href, anchor))
+        for href, anchor in raw_links:
+            href = (href or "").strip()
+            if not href:
+                continue
+            links.append((href, clean_text(anchor) or href))
 
         # de-dup by href preserving order
         seen = set()
@@ -290,12 +739,13 @@ def parse_posts_from_html(html: str, channel: str) -> List[TelegramPost]:
 
 # ---------- извлечение событий из поста ----------
 
-def extract_events_from_post(post: TelegramPost) -> List[Event]:
+def extract_events_from_post(post: TelegramPost, keywords: Optional[set] = None) -> List[Event]:
+    """keywords — результат scan_keywords(post.text), если он уже посчитан."""
     text = post.text or ""
-    low = text.lower()
+    found = scan_keywords(text) if keywords is None else keywords
 
     # Дайджест (best-effort)
-    is_digest = ("регистрация на события" in low) and (len(post.links) >= 2) and ("#дайджест" in low)
+    is_digest = all(m in found for m in DIGEST_MARKERS) and (len(post.links) >= 2)
 
     events: List[Event] = []
     if is_digest:
@@ -345,56 +795,284 @@ def extract_events_from_post(post: TelegramPost) -> List[Event]:
 # ---------- хранилище прогресса (SQLite) ----------
 
 def db_connect(path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(path)
+    # timeout: при нескольких каналах в базу параллельно пишут несколько соединений
+    conn = sqlite3.connect(path, timeout=30.0)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
     conn.execute("PRAGMA foreign_keys=ON;")
     return conn
 
+DB_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS posts(
+        channel TEXT NOT NULL,
+        post_id INTEGER NOT NULL,
+        post_url TEXT NOT NULL,
+        published_at TEXT,
+        text TEXT,
+        links_json TEXT,
+        text_hash TEXT,
+        scraped_at TEXT,
+        hints_json TEXT,
+        PRIMARY KEY(channel, post_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS events(
+        -- id — стабильный номер события (AUTOINCREMENT не переиспользует номера,
+        -- VACUUM его не трогает): водяные знаки экспорта и id в выгрузках
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        event_key TEXT NOT NULL UNIQUE,
+        source_post_id INTEGER NOT NULL,
+        source_post_url TEXT NOT NULL,
+        published_at TEXT,
+        title TEXT NOT NULL,
+        start_at TEXT,
+        location TEXT,
+        registration_url TEXT,
+        raw_text TEXT,
+        created_at TEXT
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_events_channel_post ON events(channel, source_post_id);
+
+    CREATE TABLE IF NOT EXISTS missing_posts(
+        channel TEXT NOT NULL,
+        post_id INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        tries INTEGER NOT NULL DEFAULT 0,
+        last_checked_at TEXT,
+        note TEXT,
+        PRIMARY KEY(channel, post_id)
+    );
+
+    -- счётчики изменений events по каналу: по ним экспорт понимает, что выгружать
+    CREATE TABLE IF NOT EXISTS events_revision(
+        channel TEXT PRIMARY KEY,
+        inserts INTEGER NOT NULL DEFAULT 0,
+        mutations INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_events_rev_insert AFTER INSERT ON events BEGIN
+        INSERT INTO events_revision(channel, inserts) VALUES(new.channel, 1)
+        ON CONFLICT(channel) DO UPDATE SET inserts = inserts + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_events_rev_update AFTER UPDATE ON events BEGIN
+        INSERT INTO events_revision(channel, mutations) VALUES(old.channel, 1)
+        ON CONFLICT(channel) DO UPDATE SET mutations = mutations + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_events_rev_delete AFTER DELETE ON events BEGIN
+        INSERT INTO events_revision(channel, mutations) VALUES(old.channel, 1)
+        ON CONFLICT(channel) DO UPDATE SET mutations = mutations + 1;
+    END;
+
+    -- что и на какой ревизии было выгружено в каждый файл экспорта
+    CREATE TABLE IF NOT EXISTS export_state(
+        channel TEXT NOT NULL,
+        out_path TEXT NOT NULL,
+        inserts INTEGER NOT NULL,
+        mutations INTEGER NOT NULL,
+        max_id INTEGER NOT NULL,
+        events_count INTEGER NOT NULL,
+        exported_at TEXT,
+        PRIMARY KEY(channel, out_path)
+    );
+
+    -- скорость запросов, выученная AdaptiveRateController, между запусками
+    CREATE TABLE IF NOT EXISTS rate_state(
+        host TEXT PRIMARY KEY,
+        rate REAL NOT NULL,
+        updated_at TEXT
+    );
+
+    -- последний чекпоинт режима по каналу (то же, что checkpoint.json, но для всех каналов)
+    CREATE TABLE IF NOT EXISTS channel_state(
+        channel TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        state_json TEXT NOT NULL,
+        updated_at TEXT,
+        PRIMARY KEY(channel, mode)
+    );
+
+    -- параллельная догрузка истории: диапазоны id [lo, hi] и курсор ?before= внутри каждого
+    CREATE TABLE IF NOT EXISTS backfill_partitions(
+        channel TEXT NOT NULL,
+        lo INTEGER NOT NULL,
+        hi INTEGER NOT NULL,
+        cursor INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        pages INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT,
+        PRIMARY KEY(channel, lo)
+    );
+"""
+
+def db_migrate_events_id(conn: sqlite3.Connection) -> bool:
+    """
+    Переводит events старой схемы (ключ event_key, экспорт по rowid) на стабильный id.
+    Строки копируются с id = прежний rowid; export_state сбрасывается (водяные знаки были
+    по rowid), events_fts пересоздаётся с content_rowid='id'. True — миграция была.
+    """
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(events)")]
+    if "id" in cols:
+        return False
+    logging.info("Migrating events table to a stable id column...")
+    names = ", ".join(cols)
+    ddl = DB_SCHEMA[DB_SCHEMA.index("CREATE TABLE IF NOT EXISTS events("):]
+    ddl = ddl[:ddl.index(");") + 2].replace("IF NOT EXISTS events(", "events_new(")
+    with conn:
+        conn.execute("BEGIN")
+        conn.execute(ddl)
+        conn.execute(f"INSERT INTO events_new(id, {names}) SELECT rowid, {names} FROM events ORDER BY rowid")
+        # вместе с таблицей уходят её индекс и триггеры, их вернёт повторный DB_SCHEMA
+        conn.execute("DROP TABLE events")
+        conn.execute("DROP TABLE IF EXISTS events_fts")
+        conn.execute("ALTER TABLE events_new RENAME TO events")
+        conn.execute("DROP TABLE IF EXISTS export_state")
+    return True
+
 def db_init(conn: sqlite3.Connection) -> None:
-    conn.executescript(
-        """
-        CREATE TABLE IF NOT EXISTS posts(
-            channel TEXT NOT NULL,
-            post_id INTEGER NOT NULL,
-            post_url TEXT NOT NULL,
-            published_at TEXT,
-            text TEXT,
-            links_json TEXT,
-            text_hash TEXT,
-            scraped_at TEXT,
-            PRIMARY KEY(channel, post_id)
-        );
-
-        CREATE TABLE IF NOT EXISTS events(
-            channel TEXT NOT NULL,
-            event_key TEXT PRIMARY KEY,
-            source_post_id INTEGER NOT NULL,
-            source_post_url TEXT NOT NULL,
-            published_at TEXT,
-            title TEXT NOT NULL,
-            start_at TEXT,
-            location TEXT,
-            registration_url TEXT,
-            raw_text TEXT,
-            created_at TEXT
-        );
-
-        CREATE INDEX IF NOT EXISTS idx_events_channel_post ON events(channel, source_post_id);
-
-        CREATE TABLE IF NOT EXISTS missing_posts(
-            channel TEXT NOT NULL,
-            post_id INTEGER NOT NULL,
-            status TEXT NOT NULL,
-            tries INTEGER NOT NULL DEFAULT 0,
-            last_checked_at TEXT,
-            note TEXT,
-            PRIMARY KEY(channel, post_id)
-        );
-        """
-    )
+    conn.executescript(DB_SCHEMA)
+    if db_migrate_events_id(conn):
+        conn.executescript(DB_SCHEMA)
+    # колонки, добавленные после первой версии схемы
+    db_add_column(conn, "posts", "hints_json", "TEXT")
+    db_add_column(conn, "export_state", "format", "TEXT")
+    db_init_fts(conn)
     conn.commit()
 
+# Полнотекстовый поиск (FTS5) по posts.text и events.title/location/raw_text.
+# Таблицы external content: текст хранится только в posts/events, индекс ведут триггеры,
+# строки связаны: события — по стабильному events.id, посты — по rowid. VACUUM может
+# перенумеровать rowid posts — после него нужен db_rebuild_fts (или --search-rebuild).
+FTS_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        text,
+        content='posts', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+        title, location, raw_text,
+        content='events', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_posts_fts_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts(rowid, text) VALUES(new.rowid, new.text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_posts_fts_delete AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, text) VALUES('delete', old.rowid, old.text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_posts_fts_update AFTER UPDATE OF text ON posts BEGIN
+        INSERT INTO posts_fts(posts_fts, rowid, text) VALUES('delete', old.rowid, old.text);
+        INSERT INTO posts_fts(rowid, text) VALUES(new.rowid, new.text);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_events_fts_insert AFTER INSERT ON events BEGIN
+        INSERT INTO events_fts(rowid, title, location, raw_text)
+        VALUES(new.id, new.title, new.location, new.raw_text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_events_fts_delete AFTER DELETE ON events BEGIN
+        INSERT INTO events_fts(events_fts, rowid, title, location, raw_text)
+        VALUES('delete', old.id, old.title, old.location, old.raw_text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_events_fts_update AFTER UPDATE OF title, location, raw_text ON events BEGIN
+        INSERT INTO events_fts(events_fts, rowid, title, location, raw_text)
+        VALUES('delete', old.id, old.title, old.location, old.raw_text);
+        INSERT INTO events_fts(rowid, title, location, raw_text)
+        VALUES(new.id, new.title, new.location, new.raw_text);
+    END;
+"""
+
+def db_has_fts(conn: sqlite3.Connection) -> bool:
+    row = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN ('posts_fts', 'events_fts')"
+    ).fetchone()
+    return row[0] == 2
+
+def db_rebuild_fts(conn: sqlite3.Connection) -> None:
+    with conn:
+        conn.execute("INSERT INTO posts_fts(posts_fts) VALUES('rebuild')")
+        conn.execute("INSERT INTO events_fts(events_fts) VALUES('rebuild')")
+
+def db_init_fts(conn: sqlite3.Connection) -> bool:
+    """Создаёт FTS5-индексы (и наполняет их для уже существующей базы). False — SQLite собран без FTS5."""
+    existed = db_has_fts(conn)
+    try:
+        conn.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        logging.debug("SQLite has no FTS5, full-text search disabled: %s", e)
+        return False
+    if not existed:
+        db_rebuild_fts(conn)
+    return True
+
+def db_add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+def db_load_rates(conn: sqlite3.Connection) -> Dict[str, float]:
+    return dict(conn.execute("SELECT host, rate FROM rate_state"))
+
+def db_save_rates(conn: sqlite3.Connection, rates: Dict[str, float]) -> None:
+    with conn:
+        conn.executemany(
+            """
+            INSERT INTO rate_state(host, rate, updated_at) VALUES(?,?,?)
+            ON CONFLICT(host) DO UPDATE SET rate=excluded.rate, updated_at=excluded.updated_at
+            """,
+            [(host, rate, now_iso()) for host, rate in rates.items()],
+        )
+
+def db_load_channel_state(conn: sqlite3.Connection, channel: str, mode: str) -> Optional[dict]:
+    row = conn.execute("SELECT state_json FROM channel_state WHERE channel=? AND mode=?", (channel, mode)).fetchone()
+    return json.loads(row[0]) if row else None
+
+def db_save_channel_state(conn: sqlite3.Connection, channel: str, mode: str, state: dict) -> None:
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO channel_state(channel, mode, state_json, updated_at) VALUES(?,?,?,?)
+            ON CONFLICT(channel, mode) DO UPDATE SET state_json=excluded.state_json, updated_at=excluded.updated_at
+            """,
+            (channel, mode, json.dumps(state, ensure_ascii=False), now_iso()),
+        )
+
+def db_post_fingerprints(conn: sqlite3.Connection, channel: str, ids: List[int]) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+    """post_id -> (text_hash, links_json) для уже сохранённых постов из ids, одним запросом."""
+    if not ids:
+        return {}
+    q = f"SELECT post_id, text_hash, links_json FROM posts WHERE channel=? AND post_id IN ({','.join(['?']*len(ids))})"
+    return {r[0]: (r[1], r[2]) for r in conn.execute(q, [channel, *ids])}
+
+def db_recheck_from_id(conn: sqlite3.Connection, channel: str, last_posts: int, days: float) -> Optional[int]:
+    """
+    Нижняя граница окна перепроверки: id, начиная с которого известные посты сравниваются
+    со свежими (последние last_posts постов и/или опубликованные за days дней). None — окно выключено.
+    """
+    bounds = []
+    if last_posts > 0:
+        row = conn.execute(
+            "SELECT MIN(post_id) FROM (SELECT post_id FROM posts WHERE channel=? ORDER BY post_id DESC LIMIT ?)",
+            (channel, last_posts),
+        ).fetchone()
+        if row[0] is not None:
+            bounds.append(row[0])
+    if days > 0:
+        # published_at хранится в UTC (как в datetime страницы t.me) — сравниваем строки в том же виде
+        cutoff = (datetime.now(ZoneInfo("UTC")) - timedelta(days=days)).isoformat()
+        row = conn.execute(
+            "SELECT MIN(post_id) FROM posts WHERE channel=? AND published_at >= ?",
+            (channel, cutoff),
+        ).fetchone()
+        if row[0] is not None:
+            bounds.append(row[0])
+    return min(bounds) if bounds else None
+
 def db_existing_post_ids(conn: sqlite3.Connection, channel: str, ids: List[int]) -> set:
     if not ids:
         return set()
@@ -402,68 +1080,206 @@ def db_existing_post_ids(conn: sqlite3.Connection, channel: str, ids: List[int])
     rows = conn.execute(q, [channel, *ids]).fetchall()
     return {r[0] for r in rows}
 
-def db_insert_post(conn: sqlite3.Connection, post: TelegramPost) -> bool:
+SQL_INSERT_POST = """
+    INSERT OR IGNORE INTO posts(channel, post_id, post_url, published_at, text, links_json, text_hash, scraped_at, hints_json)
+    VALUES(?,?,?,?,?,?,?,?,?)
+"""
+
+SQL_UPDATE_POST = """
+    UPDATE posts SET post_url=?, published_at=?, text=?, links_json=?, text_hash=?, scraped_at=?, hints_json=?
+    WHERE channel=? AND post_id=?
+"""
+
+SQL_INSERT_EVENT = """
+    INSERT OR IGNORE INTO events(
+        channel, event_key, source_post_id, source_post_url, published_at,
+        title, start_at, location, registration_url, raw_text, created_at
+    ) VALUES(?,?,?,?,?,?,?,?,?,?,?)
+"""
+
+SQL_MARK_MISSING = """
+    INSERT INTO missing_posts(channel, post_id, status, tries, last_checked_at, note)
+    VALUES(?,?,?,?,?,?)
+    ON CONFLICT(channel, post_id) DO UPDATE SET
+        status=excluded.status,
+        tries=missing_posts.tries + 1,
+        last_checked_at=excluded.last_checked_at,
+        note=excluded.note
+"""
+
+def post_row(post: TelegramPost, hints: Optional[List[str]] = None) -> tuple:
+    """hints — почему пост считается анонсом (match_event_hints); None — не проверялось."""
     links_json = json.dumps([{"href": h, "text": t} for h, t in post.links], ensure_ascii=False)
-    text_hash = sha1(post.text or "")
-    cur = conn.execute(
-        """
-        INSERT OR IGNORE INTO posts(channel, post_id, post_url, published_at, text, links_json, text_hash, scraped_at)
-        VALUES(?,?,?,?,?,?,?,?)
-        """,
-        (
-            post.channel,
-            post.post_id,
-            post.post_url,
-            post.published_at.isoformat() if post.published_at else None,
-            post.text,
-            links_json,
-            text_hash,
-            now_iso(),
-        ),
+    return (
+        post.channel,
+        post.post_id,
+        post.post_url,
+        post.published_at.isoformat() if post.published_at else None,
+        post.text,
+        links_json,
+        sha1(post.text or ""),
+        now_iso(),
+        json.dumps(hints, ensure_ascii=False) if hints is not None else None,
     )
-    conn.commit()
-    return cur.rowcount == 1
 
-def db_insert_event(conn: sqlite3.Connection, ev: Event) -> bool:
-    ek = event_key(ev)
-    cur = conn.execute(
-        """
-        INSERT OR IGNORE INTO events(
-            channel, event_key, source_post_id, source_post_url, published_at,
-            title, start_at, location, registration_url, raw_text, created_at
-        ) VALUES(?,?,?,?,?,?,?,?,?,?,?)
-        """,
-        (
-            ev.channel,
-            ek,
-            ev.source_post_id,
-            ev.source_post_url,
-            ev.published_at,
-            ev.title,
-            ev.start_at,
-            ev.location,
-            ev.registration_url,
-            ev.raw_text,
-            now_iso(),
-        ),
+def event_row(ev: Event, ek: Optional[str] = None) -> tuple:
+    return (
+        ev.channel,
+        ek or event_key(ev),
+        ev.source_post_id,
+        ev.source_post_url,
+        ev.published_at,
+        ev.title,
+        ev.start_at,
+        ev.location,
+        ev.registration_url,
+        ev.raw_text,
+        now_iso(),
     )
-    conn.commit()
-    return cur.rowcount == 1
 
-def db_mark_missing(conn: sqlite3.Connection, channel: str, post_id: int, status: str, note: str = "") -> None:
-    conn.execute(
-        """
-        INSERT INTO missing_posts(channel, post_id, status, tries, last_checked_at, note)
-        VALUES(?,?,?,?,?,?)
-        ON CONFLICT(channel, post_id) DO UPDATE SET
-            status=excluded.status,
-            tries=missing_posts.tries + 1,
-            last_checked_at=excluded.last_checked_at,
-            note=excluded.note
-        """,
-        (channel, post_id, status, 1, now_iso(), note),
-    )
-    conn.commit()
+def db_existing_event_keys(conn: sqlite3.Connection, keys: List[str]) -> set:
+    found = set()
+    # чанками, чтобы не упереться в лимит параметров SQLite
+    for i in range(0, len(keys), 500):
+        chunk = keys[i:i + 500]
+        q = f"SELECT event_key FROM events WHERE event_key IN ({','.join(['?']*len(chunk))})"
+        found.update(r[0] for r in conn.execute(q, chunk))
+    return found
+
+
+class DbWriter:
+    """
+    Write-behind запись в SQLite: посты, события и отметки missing_posts копятся
+    в памяти и уходят одной транзакцией (executemany) при flush().
+    Всё, что было до flush(), после него закоммичено — на этом держатся чекпоинты.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, batch_size: int = 200):
+        self.conn = conn
+        self.batch_size = max(1, batch_size)
+        self._posts: List[tuple] = []
+        self._events: Dict[str, Event] = {}  # event_key -> Event, первый выигрывает (как INSERT OR IGNORE)
+        self._missing: List[tuple] = []
+        # отредактированные в канале посты: (post_row, channel, post_id, события заново)
+        self._edits: List[Tuple[tuple, str, int, List[Event]]] = []
+        # всего вставлено этим writer'ом (только реально новые строки)
+        self.inserted_posts = 0
+        self.inserted_events = 0
+        self.updated_posts = 0
+        self.replaced_events = (0, 0, 0)  # вставлено, обновлено, удалено — по правкам
+
+    @property
+    def pending(self) -> int:
+        return len(self._posts) + len(self._events) + len(self._missing) + len(self._edits)
+
+    @property
+    def full(self) -> bool:
+        return self.pending >= self.batch_size
+
+    def add_post(self, post: TelegramPost, hints: Optional[List[str]] = None) -> None:
+        self._posts.append(post_row(post, hints))
+
+    def add_event(self, ev: Event) -> None:
+        self._events.setdefault(event_key(ev), ev)
+
+    def mark_missing(self, channel: str, post_id: int, status: str, note: str = "") -> None:
+        self._missing.append((channel, post_id, status, 1, now_iso(), note))
+
+    def update_post(self, post: TelegramPost, hints: Optional[List[str]], events: List[Event]) -> None:
+        """Пост изменился в канале: перезаписать его и заменить события на events."""
+        self._edits.append((post_row(post, hints), post.channel, post.post_id, events))
+
+    def flush(self) -> List[Event]:
+        """Пишет накопленное одной транзакцией. Возвращает события, которых раньше не было в БД."""
+        if not self.pending:
+            return []
+
+        new_events: List[Event] = []
+        with STATS.stage("db_write"), self.conn:
+            if self._posts:
+                # rowcount executemany — сумма по строкам без изменений из триггеров
+                self.inserted_posts += self.conn.executemany(SQL_INSERT_POST, self._posts).rowcount
+
+            if self._events:
+                known = db_existing_event_keys(self.conn, list(self._events))
+                fresh = [(ek, ev) for ek, ev in self._events.items() if ek not in known]
+                self.conn.executemany(SQL_INSERT_EVENT, [event_row(ev, ek) for ek, ev in fresh])
+                new_events = [ev for _, ev in fresh]
+                self.inserted_events += len(new_events)
+
+            if self._missing:
+                self.conn.executemany(SQL_MARK_MISSING, self._missing)
+
+            if self._edits:
+                self.conn.executemany(SQL_UPDATE_POST, [(*row[2:], row[0], row[1]) for row, _, _, _ in self._edits])
+                self.updated_posts += len(self._edits)
+                counts = _replace_post_events(self.conn, [(ch, pid, evs) for _, ch, pid, evs in self._edits])
+                self.replaced_events = tuple(a + b for a, b in zip(self.replaced_events, counts))
+
+        self._posts.clear()
+        self._events.clear()
+        self._missing.clear()
+        self._edits.clear()
+        return new_events
+
+SQL_UPSERT_EVENT = """
+    INSERT INTO events(
+        channel, event_key, source_post_id, source_post_url, published_at,
+        title, start_at, location, registration_url, raw_text, created_at
+    ) VALUES(?,?,?,?,?,?,?,?,?,?,?)
+    ON CONFLICT(event_key) DO UPDATE SET
+        source_post_url=excluded.source_post_url,
+        published_at=excluded.published_at,
+        title=excluded.title,
+        location=excluded.location,
+        raw_text=excluded.raw_text
+    WHERE events.source_post_url IS NOT excluded.source_post_url
+       OR events.published_at IS NOT excluded.published_at
+       OR events.title IS NOT excluded.title
+       OR events.location IS NOT excluded.location
+       OR events.raw_text IS NOT excluded.raw_text
+"""
+
+def db_replace_post_events(
+    conn: sqlite3.Connection,
+    items: List[Tuple[str, int, List[Event]]],
+) -> Tuple[int, int, int]:
+    """
+    Заменяет события постов на заново извлечённые: (channel, post_id, events).
+    Совпавшие по event_key строки обновляются только при реальных изменениях
+    (created_at и id сохраняются), лишние удаляются. Одна транзакция.
+    Возвращает (вставлено, обновлено, удалено).
+    """
+    with conn:
+        return _replace_post_events(conn, items)
+
+def _replace_post_events(
+    conn: sqlite3.Connection,
+    items: List[Tuple[str, int, List[Event]]],
+) -> Tuple[int, int, int]:
+    # то же без своей транзакции — для DbWriter.flush
+    rows = []
+    for _, _, events in items:
+        for ev in events:
+            rows.append(event_row(ev))
+    known = db_existing_event_keys(conn, [r[1] for r in rows])
+
+    changed = conn.executemany(SQL_UPSERT_EVENT, rows).rowcount
+    inserted = len({r[1] for r in rows} - known)
+    updated = changed - inserted
+
+    deleted = 0
+    for channel, post_id, events in items:
+        keys = list({event_key(ev) for ev in events})
+        cur = conn.execute(
+            f"""
+            DELETE FROM events
+            WHERE channel=? AND source_post_id=? AND event_key NOT IN ({','.join(['?']*len(keys))})
+            """,
+            [channel, post_id, *keys],
+        )
+        deleted += cur.rowcount
+    return inserted, updated, deleted
 
 def db_min_max_post_id(conn: sqlite3.Connection, channel: str) -> Tuple[Optional[int], Optional[int]]:
     row = conn.execute(
@@ -472,212 +1288,1623 @@ def db_min_max_post_id(conn: sqlite3.Connection, channel: str) -> Tuple[Optional
     ).fetchone()
     return row[0], row[1]
 
+def db_gap_ranges(conn: sqlite3.Connection, channel: str, start_id: int, end_id: int) -> Iterator[Tuple[int, int]]:
+    """
+    Диапазоны [a, b] внутри [start_id, end_id], не покрытые ни posts, ни missing_posts.status='not_found'.
+    Считает SQLite: идёт по первичным ключам обеих таблиц слиянием (MERGE UNION) и для каждого
+    покрытого id, за которым следующий не покрыт, ищет следующий покрытый. Ничего не
+    материализуется, строки приходят по мере обхода — можно остановиться после первых N дыр.
+    """
+    if start_id > end_id:
+        return
+    cur = conn.execute(
+        """
+        WITH covered(pid) AS (
+            SELECT post_id FROM posts WHERE channel=:ch AND post_id BETWEEN :lo AND :hi
+            UNION
+            SELECT post_id FROM missing_posts
+            WHERE channel=:ch AND status='not_found' AND post_id BETWEEN :lo AND :hi
+            -- заглушка перед диапазоном, чтобы поймать дыру в самом начале
+            UNION SELECT :lo - 1
+            ORDER BY 1
+        )
+        SELECT c.pid + 1,
+               MIN(
+                   COALESCE((SELECT MIN(post_id) FROM posts WHERE channel=:ch AND post_id > c.pid), :hi + 1),
+                   COALESCE((SELECT MIN(post_id) FROM missing_posts
+                             WHERE channel=:ch AND status='not_found' AND post_id > c.pid), :hi + 1),
+                   :hi + 1
+               ) - 1
+        FROM covered c
+        WHERE c.pid < :hi
+          AND NOT EXISTS (SELECT 1 FROM posts WHERE channel=:ch AND post_id = c.pid + 1)
+          AND NOT EXISTS (SELECT 1 FROM missing_posts
+                          WHERE channel=:ch AND status='not_found' AND post_id = c.pid + 1)
+        """,
+        {"ch": channel, "lo": start_id, "hi": end_id},
+    )
+    for gap_start, gap_end in cur:
+        yield gap_start, gap_end
+
+def db_iter_missing_ids(conn: sqlite3.Connection, channel: str, start_id: int, end_id: int) -> Iterator[int]:
+    for gap_start, gap_end in db_gap_ranges(conn, channel, start_id, end_id):
+        yield from range(gap_start, gap_end + 1)
+
 def db_missing_ids_in_range(conn: sqlite3.Connection, channel: str, start_id: int, end_id: int, limit: int) -> List[int]:
     """
     Возвращает id, которых нет в posts в пределах [start_id, end_id],
     исключая те, что уже помечены missing_posts.status='not_found' (чтобы не долбить удалённые).
+    Диапазон целиком не материализуется: берутся первые limit id из дыр (db_gap_ranges).
     """
-    # Для больших диапазонов этот запрос может быть тяжёлым, поэтому диапазон лучше держать умеренным.
-    # Мы делаем "генерацию" диапазона на Python, но ограничиваем limit.
-    existing = conn.execute(
-        "SELECT post_id FROM posts WHERE channel=? AND post_id BETWEEN ? AND ?",
-        (channel, start_id, end_id),
-    ).fetchall()
-    existing_set = {r[0] for r in existing}
+    return list(itertools.islice(db_iter_missing_ids(conn, channel, start_id, end_id), limit))
 
-    nf = conn.execute(
-        "SELECT post_id FROM missing_posts WHERE channel=? AND status='not_found' AND post_id BETWEEN ? AND ?",
-        (channel, start_id, end_id),
-    ).fetchall()
-    not_found_set = {r[0] for r in nf}
-
-    missing = []
-    for pid in range(start_id, end_id + 1):
-        if pid in existing_set or pid in not_found_set:
-            continue
-        missing.append(pid)
-        if len(missing) >= limit:
-            break
-    return missing
+EXPORT_COLUMNS = (
+    "channel", "source_post_id", "source_post_url", "published_at", "title",
+    "start_at", "location", "registration_url", "raw_text",
+)
 
-def export_events_json(conn: sqlite3.Connection, channel: str, out_path: str) -> int:
-    rows = conn.execute(
-        """
-        SELECT channel, source_post_id, source_post_url, published_at, title, start_at, location, registration_url, raw_text
-        FROM events
-        WHERE channel=?
-        ORDER BY COALESCE(start_at, ''), COALESCE(published_at, ''), source_post_id
-        """,
+# full — исторический формат (у каждого события все поля и raw_text поста);
+# compact — версия 2: текст поста один раз в разделе posts, события ссылаются на него по id
+EXPORT_FORMATS = ("full", "compact")
+COMPACT_FORMAT_VERSION = 2
+
+def _preview(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    # не резать слово посередине, если пробел недалеко
+    space = cut.rfind(" ")
+    if space > limit * 0.8:
+        cut = cut[:space]
+    return cut.rstrip() + "…"
+
+def events_payload(events: List[dict], export_format: str = "full", preview_chars: int = 0) -> dict:
+    """
+    Часть выгрузки с событиями: {"events": [...]} как есть или, для compact,
+    {"format", "version", "posts": {post_id: {...}}, "events": [...]}, где у события
+    вместо channel/source_post_url/published_at/raw_text — "post": post_id, а пустые поля
+    опущены. preview_chars > 0 — в posts вместо полного text только preview такой длины.
+    """
+    if export_format != "compact":
+        return {"events": events}
+
+    posts: Dict[str, dict] = {}
+    compact: List[dict] = []
+    for ev in events:
+        pid = ev["source_post_id"]
+        key = str(pid)
+        if key not in posts:
+            post = {"url": ev["source_post_url"], "published_at": ev["published_at"]}
+            text = ev["raw_text"] or ""
+            if preview_chars > 0:
+                post["preview"] = _preview(text, preview_chars)
+            else:
+                post["text"] = text
+            posts[key] = {k: v for k, v in post.items() if v is not None}
+        item = {"id": ev["id"], "post": pid} if "id" in ev else {"post": pid}
+        for col in ("title", "start_at", "location", "registration_url"):
+            if ev[col] is not None:
+                item[col] = ev[col]
+        compact.append(item)
+    return {"format": "compact", "version": COMPACT_FORMAT_VERSION, "posts": posts, "events": compact}
+
+def _export_sort_key(ev: dict, event_id: int) -> tuple:
+    # тот же порядок, что ORDER BY в полном пересборе
+    return (ev["start_at"] or "", ev["published_at"] or "", ev["source_post_id"], event_id)
+
+def db_events_revision(conn: sqlite3.Connection, channel: str) -> Tuple[int, int]:
+    row = conn.execute(
+        "SELECT inserts, mutations FROM events_revision WHERE channel=?",
         (channel,),
-    ).fetchall()
+    ).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
 
-    events = []
-    for r in rows:
-        events.append(
-            {
-                "channel": r[0],
-                "source_post_id": r[1],
-                "source_post_url": r[2],
-                "published_at": r[3],
-                "title": r[4],
-                "start_at": r[5],
-                "location": r[6],
-                "registration_url": r[7],
-                "raw_text": r[8],
-            }
+def share_text(texts: Dict, key, text: Optional[str]) -> Optional[str]:
+    """
+    Одна и та же строка для одинаковых текстов по ключу (посту): SQLite отдаёт raw_text
+    каждого события отдельной копией, а у событий дайджеста он общий.
+    """
+    if text is None:
+        return None
+    cached = texts.get(key)
+    if cached == text:
+        return cached
+    texts[key] = text
+    return text
+
+class ExportState(NamedTuple):
+    inserts: int
+    mutations: int
+    max_id: int
+    events_count: int
+    format: Optional[str]
+
+def db_load_export_state(conn: sqlite3.Connection, channel: str, out_path: str) -> Optional[ExportState]:
+    row = conn.execute(
+        "SELECT inserts, mutations, max_id, events_count, format FROM export_state WHERE channel=? AND out_path=?",
+        (channel, os.path.abspath(out_path)),
+    ).fetchone()
+    return ExportState(*row) if row else None
+
+def db_save_export_state(conn: sqlite3.Connection, channel: str, out_path: str, state: ExportState) -> None:
+    with conn:
+        conn.execute(
+            """
+            INSERT INTO export_state(channel, out_path, inserts, mutations, max_id, events_count, exported_at, format)
+            VALUES(?,?,?,?,?,?,?,?)
+            ON CONFLICT(channel, out_path) DO UPDATE SET
+                inserts=excluded.inserts,
+                mutations=excluded.mutations,
+                max_id=excluded.max_id,
+                events_count=excluded.events_count,
+                exported_at=excluded.exported_at,
+                format=excluded.format
+            """,
+            (channel, os.path.abspath(out_path), *state[:4], now_iso(), state.format),
         )
 
-    payload = {
-        "channel": channel,
-        "events_count": len(events),
-        "generated_at": now_iso(),
-        "events": events,
-    }
-    atomic_write_json(out_path, payload)
-    return len(events)
 
+class EventsExporter:
+    """
+    Экспорт событий канала в JSON с водяным знаком.
+
+    Ревизия канала — счётчики вставок и правок/удалений в events_revision (их ведут триггеры).
+      - ревизия не изменилась с прошлой выгрузки (в т.ч. прошлого запуска) -> экспорт пропускается;
+      - были только вставки -> дочитываются строки с id > водяного знака и вливаются
+        в уже отсортированный список;
+      - были UPDATE/DELETE или списка ещё нет в памяти -> полный пересбор.
+    """
 
-# ---------- режимы скачивания ----------
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        channel: str,
+        out_path: str,
+        export_format: str = "full",
+        minify: bool = False,
+        preview_chars: int = 0,
+    ):
+        self.conn = conn
+        self.channel = channel
+        self.out_path = out_path
+        self.export_format = export_format
+        self.minify = minify
+        self.preview_chars = preview_chars
+        # смена формата — повод перезаписать файл, даже если событий не прибавилось
+        self.format_sig = f"{export_format}/{int(minify)}/{preview_chars}"
+        self._events: List[dict] = []
+        self._keys: List[tuple] = []
+        # текст поста -> одна строка на все его события (в дайджесте их десятки)
+        self._texts: Dict[int, str] = {}
+        self._loaded = False
+        self._max_id = 0
+        self._mutations = 0
+
+    def _saved_state(self) -> Optional[Tuple[int, int, int]]:
+        st = db_load_export_state(self.conn, self.channel, self.out_path)
+        if not st or (st.format or "full/0/0") != self.format_sig:
+            return None
+        return (st.inserts, st.mutations, st.events_count)
+
+    def _save_state(self, inserts: int, mutations: int) -> None:
+        db_save_export_state(
+            self.conn, self.channel, self.out_path,
+            ExportState(inserts, mutations, self._max_id, len(self._events), self.format_sig),
+        )
 
-def make_session() -> requests.Session:
-    s = requests.Session()
-    s.headers.update(
-        {
-            "User-Agent": "Mozilla/5.0 (compatible; tg-events-parser/2.0; +https://t.me)",
-            "Accept-Language": "ru,en;q=0.8",
+    def _select(self, min_id: int) -> List[Tuple[tuple, dict]]:
+        rows = self.conn.execute(
+            f"""
+            SELECT id, {", ".join(EXPORT_COLUMNS)}
+            FROM events
+            WHERE channel=? AND id > ?
+            """,
+            (self.channel, min_id),
+        )
+        out = []
+        for r in rows:
+            # id события стабилен между выгрузками, на него ссылается поисковый индекс
+            ev = {"id": r[0], **dict(zip(EXPORT_COLUMNS, r[1:]))}
+            ev["raw_text"] = share_text(self._texts, ev["source_post_id"], ev["raw_text"])
+            out.append((_export_sort_key(ev, r[0]), ev))
+            self._max_id = max(self._max_id, r[0])
+        return out
+
+    def _rebuild(self) -> None:
+        self._max_id = 0
+        self._texts = {}
+        rows = self._select(0)
+        rows.sort(key=lambda kv: kv[0])
+        self._keys = [k for k, _ in rows]
+        self._events = [ev for _, ev in rows]
+        self._loaded = True
+
+    def _merge_new(self) -> int:
+        rows = self._select(self._max_id)
+        for key, ev in rows:
+            i = bisect.bisect(self._keys, key)
+            self._keys.insert(i, key)
+            self._events.insert(i, ev)
+        return len(rows)
+
+    def export(self, force: bool = False) -> int:
+        with STATS.stage("export"):
+            return self._export(force)
+
+    def _export(self, force: bool) -> int:
+        inserts, mutations = db_events_revision(self.conn, self.channel)
+
+        saved = self._saved_state()
+        if not force and saved and saved[:2] == (inserts, mutations) and os.path.exists(self.out_path):
+            logging.debug("Export skipped, no changes since last export: %s", self.out_path)
+            return saved[2]
+
+        if force or not self._loaded or mutations != self._mutations:
+            self._rebuild()
+        else:
+            added = self._merge_new()
+            logging.debug("Export: merged %d new events", added)
+        self._mutations = mutations
+
+        payload = {
+            "channel": self.channel,
+            "events_count": len(self._events),
+            "generated_at": now_iso(),
+            **events_payload(self._events, self.export_format, self.preview_chars),
         }
-    )
-    return s
+        atomic_write_json(self.out_path, payload, minify=self.minify)
+        self._save_state(inserts, mutations)
+        return len(self._events)
 
-def fetch_feed_page(session: requests.Session, channel: str, before: Optional[int]) -> str:
-    base = f"https://t.me/s/{channel}"
-    url = base if before is None else f"{base}?before={before}"
-    resp = get_with_retries(session, url=url)
-    return resp.text
 
-def fetch_single_post(session: requests.Session, channel: str, post_id: int) -> str:
-    # Страница конкретного поста (публичная)
-    url = f"https://t.me/{channel}/{post_id}"
-    resp = get_with_retries(session, url=url)
-    return resp.text
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
 
-def append_jsonl(path: str, obj: dict) -> None:
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-        f.flush()
-        os.fsync(f.fileno())
+class StreamingEventsExporter:
+    """
+    Экспорт событий одного или нескольких каналов потоком: строки идут из курсора SQLite
+    (сортирует сам SQLite, при нехватке памяти — во временных файлах) и сразу пишутся
+    во временный файл, который в конце атомарно подменяет out_path. Память не зависит
+    от размера архива. Формат — full: объект с массивом events (events_count — после
+    массива, он известен только в конце) или, для .ndjson/.jsonl, по событию на строку.
+    Пропускается, если ревизия каналов не изменилась с прошлой выгрузки.
+    """
 
+    def __init__(self, conn: sqlite3.Connection, channels: List[str], out_path: str):
+        self.conn = conn
+        self.channels = sorted(channels)
+        self.out_path = out_path
+        self.ndjson = out_path.lower().endswith(NDJSON_SUFFIXES)
+        # строка export_state: канал или набор каналов, как у MergedEventsExporter
+        self.state_key = "+".join(self.channels)
+        self.format_sig = "ndjson" if self.ndjson else "stream"
+
+    def export(self, force: bool = False) -> int:
+        with STATS.stage("export"):
+            return self._export(force)
+
+    def _rows(self) -> Iterator[dict]:
+        cur = self.conn.execute(
+            f"""
+            SELECT id, {", ".join(EXPORT_COLUMNS)}
+            FROM events
+            WHERE channel IN ({",".join("?" * len(self.channels))})
+            ORDER BY COALESCE(start_at, ''), COALESCE(published_at, ''), source_post_id, id
+            """,
+            self.channels,
+        )
+        for r in cur:
+            yield {"id": r[0], **dict(zip(EXPORT_COLUMNS, r[1:]))}
+
+    def _export(self, force: bool) -> int:
+        inserts = mutations = 0
+        for ch in self.channels:
+            i, m = db_events_revision(self.conn, ch)
+            inserts, mutations = inserts + i, mutations + m
+
+        saved = db_load_export_state(self.conn, self.state_key, self.out_path)
+        if (
+            not force and saved and saved.format == self.format_sig
+            and (saved.inserts, saved.mutations) == (inserts, mutations) and os.path.exists(self.out_path)
+        ):
+            logging.debug("Streaming export skipped, no changes since last export: %s", self.out_path)
+            return saved.events_count
+
+        count = max_id = 0
+        tmp = f"{self.out_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            if not self.ndjson:
+                head = {"channel": self.channels[0]} if len(self.channels) == 1 else {"channels": self.channels}
+                head["generated_at"] = now_iso()
+                # заголовок объекта без закрывающей скобки, дальше — массив по одному событию
+                f.write(json.dumps(head, ensure_ascii=False)[:-1] + ', "events": [\n')
+            for ev in self._rows():
+                line = json.dumps(ev, ensure_ascii=False)
+                if self.ndjson:
+                    f.write(line + "\n")
+                else:
+                    f.write((",\n" if count else "") + line)
+                count += 1
+                max_id = max(max_id, ev["id"])
+            if not self.ndjson:
+                f.write(f'\n], "events_count": {count}}}\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.out_path)
+
+        db_save_export_state(
+            self.conn, self.state_key, self.out_path,
+            ExportState(inserts, mutations, max_id, count, self.format_sig),
+        )
+        return count
 
-def run_update_mode(
-    conn: sqlite3.Connection,
-    channel: str,
-    max_pages: int,
-    max_posts: int,
-    stop_after_known: int,
-    sleep_sec: float,
-    checkpoint_every: int,
-    export_path: Optional[str],
-    checkpoint_path: Optional[str],
-    events_jsonl: Optional[str],
-) -> None:
-    session = make_session()
 
-    before = None
-    pages = 0
-    processed_posts = 0
-    inserted_posts = 0
-    inserted_events = 0
-    known_streak = 0
+SHARD_BY = {
+    # ключ шарда по дате публикации: новые посты попадают только в текущий шард
+    "month": "substr(published_at, 1, 7)",
+    "year": "substr(published_at, 1, 4)",
+}
+UNDATED_SHARD = "undated"
+SHARD_FILE_RE = re.compile(r"^(\d{4}(?:-\d{2})?|undated)\.[0-9a-f]{12}\.json$")
 
-    def do_checkpoint():
-        nonlocal export_path, checkpoint_path
-        if checkpoint_path:
-            atomic_write_json(
-                checkpoint_path,
-                {
-                    "channel": channel,
-                    "mode": "update",
-                    "before": before,
-                    "pages": pages,
-                    "processed_posts": processed_posts,
-                    "inserted_posts": inserted_posts,
-                    "inserted_events": inserted_events,
-                    "known_streak": known_streak,
-                    "updated_at": now_iso(),
-                },
-            )
-        if export_path:
-            cnt = export_events_json(conn, channel, export_path)
-            logging.info("Checkpoint export: %s events -> %s", cnt, export_path)
 
-    while pages < max_pages and processed_posts < max_posts:
-        try:
-            html = fetch_feed_page(session, channel, before=before)
-        except Exception as e:
-            logging.exception("Failed to fetch feed page (before=%s): %s", before, e)
-            do_checkpoint()
-            return
+class ShardedEventsExporter:
+    """
+    Экспорт событий канала шардами по месяцам/годам публикации + manifest.json.
 
-        posts = parse_posts_from_html(html, channel)
-        if not posts:
-            logging.info("No posts found on page, stopping.")
-            do_checkpoint()
-            return
+    Имя шарда содержит хэш содержимого (2026-02.<sha256[:12]>.json), в самом шарде нет
+    времени генерации — неизменившиеся шарды сохраняют имя и байты, их можно кэшировать
+    навсегда. Пересчитываются только шарды, куда попали строки с id > водяного знака;
+    после UPDATE/DELETE — все, но перезаписываются лишь те, чей хэш изменился.
+    Файлы, на которые не ссылается ни новый, ни предыдущий манифест, удаляются.
+    """
 
-        pages += 1
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        channel: str,
+        out_dir: str,
+        shard_by: str = "month",
+        export_format: str = "full",
+        preview_chars: int = 0,
+    ):
+        if shard_by not in SHARD_BY:
+            raise ValueError(f"Unknown shard_by: {shard_by}")
+        self.conn = conn
+        self.channel = channel
+        self.out_dir = out_dir
+        self.shard_by = shard_by
+        self.export_format = export_format
+        self.preview_chars = preview_chars
+        self.manifest_path = os.path.join(out_dir, "manifest.json")
+        self._key_sql = f"COALESCE({SHARD_BY[shard_by]}, '{UNDATED_SHARD}')"
+
+    def _saved_state(self) -> Optional[Tuple[int, int, int]]:
+        st = db_load_export_state(self.conn, self.channel, self.manifest_path)
+        return (st.inserts, st.mutations, st.max_id) if st else None
+
+    def _save_state(self, inserts: int, mutations: int, max_id: int, events_count: int) -> None:
+        db_save_export_state(
+            self.conn, self.channel, self.manifest_path,
+            ExportState(inserts, mutations, max_id, events_count, None),
+        )
 
-        ids = [p.post_id for p in posts]
-        existing = db_existing_post_ids(conn, channel, ids)
+    def _load_manifest(self) -> Optional[dict]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (manifest.get("channel"), manifest.get("shard_by"), manifest.get("format", "full"), manifest.get("preview_chars", 0)) != (
+            self.channel, self.shard_by, self.export_format, self.preview_chars
+        ):
+            return None
+        return manifest
+
+    def _shard_keys(self, min_id: int) -> List[str]:
+        rows = self.conn.execute(
+            f"SELECT DISTINCT {self._key_sql} FROM events WHERE channel=? AND id > ?",
+            (self.channel, min_id),
+        )
+        return [r[0] for r in rows]
+
+    def _write_shard(self, key: str) -> Optional[dict]:
+        """Собирает шард key; пишет файл, только если такого содержимого ещё нет. None — шард пуст."""
+        rows = self.conn.execute(
+            f"""
+            SELECT id, {", ".join(EXPORT_COLUMNS)}
+            FROM events
+            WHERE channel=? AND {self._key_sql} = ?
+            ORDER BY COALESCE(start_at, ''), COALESCE(published_at, ''), source_post_id, id
+            """,
+            (self.channel, key),
+        ).fetchall()
+        if not rows:
+            return None
+        events = [{"id": r[0], **dict(zip(EXPORT_COLUMNS, r[1:]))} for r in rows]
+        body = json.dumps(
+            {"channel": self.channel, "shard": key, **events_payload(events, self.export_format, self.preview_chars)},
+            ensure_ascii=False, separators=(",", ":"),
+        ).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        name = f"{key}.{digest[:12]}.json"
+        path = os.path.join(self.out_dir, name)
+        if not os.path.exists(path):
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            logging.debug("Shard written: %s (%d events)", name, len(events))
+
+        published = [ev["published_at"] for ev in events if ev["published_at"]]
+        starts = [ev["start_at"] for ev in events if ev["start_at"]]
+        return {
+            "key": key,
+            "url": name,
+            "count": len(events),
+            "bytes": len(body),
+            "sha256": digest,
+            "published_from": min(published) if published else None,
+            "published_to": max(published) if published else None,
+            "start_from": min(starts) if starts else None,
+            "start_to": max(starts) if starts else None,
+        }
 
-        # Новые -> старые
-        for p in posts:
-            if processed_posts >= max_posts:
-                break
+    def _cleanup(self, keep: set) -> None:
+        for name in os.listdir(self.out_dir):
+            if SHARD_FILE_RE.match(name) and name not in keep:
+                try:
+                    os.remove(os.path.join(self.out_dir, name))
+                except OSError:
+                    logging.warning("Failed to remove stale shard %s", name)
+
+    def export(self, force: bool = False) -> int:
+        with STATS.stage("export"):
+            return self._export(force)
+
+    def _export(self, force: bool) -> int:
+        inserts, mutations = db_events_revision(self.conn, self.channel)
+        saved = self._saved_state()
+        prev = self._load_manifest()
+
+        if not force and prev and saved and saved[:2] == (inserts, mutations):
+            logging.debug("Sharded export skipped, no changes since last export: %s", self.out_dir)
+            return prev["events_count"]
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        max_id = self.conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM events WHERE channel=?", (self.channel,)
+        ).fetchone()[0]
+
+        shards: Dict[str, dict] = {}
+        if force or not prev or not saved or saved[1] != mutations:
+            dirty = self._shard_keys(0)
+        else:
+            shards = {sh["key"]: sh for sh in prev["shards"]}
+            dirty = self._shard_keys(saved[2])
+
+        for key in dirty:
+            entry = self._write_shard(key)
+            if entry:
+                shards[key] = entry
+            else:
+                shards.pop(key, None)
+
+        # новые шарды — первыми, "undated" — в конце
+        ordered = sorted(shards.values(), key=lambda sh: sh["key"], reverse=True)
+        ordered.sort(key=lambda sh: sh["key"] == UNDATED_SHARD)
+        total = sum(sh["count"] for sh in ordered)
+        manifest = {
+            "version": 1,
+            "channel": self.channel,
+            "shard_by": self.shard_by,
+            "format": self.export_format,
+            "preview_chars": self.preview_chars,
+            "events_count": total,
+            "generated_at": now_iso(),
+            "shards": ordered,
+        }
+        atomic_write_json(self.manifest_path, manifest)
 
-            processed_posts += 1
+        keep = {sh["url"] for sh in ordered}
+        if prev:
+            # клиенты со старым манифестом ещё могут дочитывать его шарды
+            keep.update(sh["url"] for sh in prev["shards"])
+        self._cleanup(keep)
 
-            if p.post_id in existing:
-                known_streak += 1
-                # если долго подряд встречаем уже известные, значит догнали “хвост”
-                if known_streak >= stop_after_known:
-                    logging.info("Stop condition reached: %d known posts in a row.", known_streak)
-                    do_checkpoint()
-                    return
-                continue
+        self._save_state(inserts, mutations, max_id, total)
+        logging.debug("Sharded export: %d shards rebuilt, %d total", len(dirty), len(ordered))
+        return total
 
-            # Это новый пост
-            known_streak = 0
 
-            try:
-                if db_insert_post(conn, p):
-                    inserted_posts += 1
+# ---------- поисковый индекс для страницы событий ----------
 
-                if is_eventish_post(p.text):
-                    for ev in extract_events_from_post(p):
-                        if db_insert_event(conn, ev):
-                            inserted_events += 1
-                            if events_jsonl:
-                                append_jsonl(events_jsonl, ev.__dict__)
+# Нормализация — ровно как normalizeSearchTokens в public/assets/js/events-page.js:
+# нижний регистр, ё -> е, слова из [0-9a-zа-я], без стоп-слов и однобуквенных,
+# опционально — отрезание одного окончания (самое длинное из SEARCH_SUFFIXES, основа >= 3 букв).
+SEARCH_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+SEARCH_STOPWORDS = frozenset(
+    "и в во на с со по о об к ко за от до из у для не но а или что как это the and of to in".split()
+)
+SEARCH_SUFFIXES = tuple(sorted(
+    "иями ами ями ого его ому ему ыми ими иях иям ой ей ий ый ая яя ое ее ые ие ых их ым им ия ии ию "
+    "ов ев ам ям ах ях ом ем ую юю ью а я о е ы и у ю ь".split(),
+    key=len, reverse=True,
+))
+SEARCH_INDEX_VERSION = 1
+
+def stem_ru(token: str) -> str:
+    for suf in SEARCH_SUFFIXES:
+        if token.endswith(suf) and len(token) - len(suf) >= 3:
+            return token[: -len(suf)]
+    return token
+
+def search_tokens(text: str, stem: bool = True) -> set:
+    out = set()
+    for tok in SEARCH_TOKEN_RE.findall((text or "").lower().replace("ё", "е")):
+        if len(tok) < 2 or tok in SEARCH_STOPWORDS:
+            continue
+        out.add(stem_ru(tok) if stem else tok)
+    return out
 
-            except Exception as e:
-                logging.exception("Error processing post %s: %s", p.post_url, e)
-                # продолжаем, прогресс в БД уже частично сохранён
-                pass
 
-            if checkpoint_every > 0 and (inserted_posts + inserted_events) % checkpoint_every == 0:
-                do_checkpoint()
+class SearchIndexExporter:
+    """
+    Инвертированный индекс по title/location/raw_text: термин -> отсортированный список id событий.
+    Ведётся по той же ревизии, что и EventsExporter: при одних вставках к индексу из файла
+    добавляются только события с id > водяного знака, после UPDATE/DELETE — полный пересбор.
+    """
 
-        # pagination
-        min_id = min(p.post_id for p in posts)
-        if before == min_id:
-            logging.info("Pagination stuck (before repeats), stopping.")
-            do_checkpoint()
-            return
-        before = min_id
+    def __init__(self, conn: sqlite3.Connection, channel: str, out_path: str, stem: bool = True):
+        self.conn = conn
+        self.channel = channel
+        self.out_path = out_path
+        self.stem = stem
+        self.format_sig = f"index/{SEARCH_INDEX_VERSION}/{'stem' if stem else 'plain'}"
 
-        time.sleep(sleep_sec)
+    def _load(self) -> Optional[dict]:
+        try:
+            with open(self.out_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get("channel") == self.channel else None
+
+    def _add_rows(self, terms: Dict[str, List[int]], min_id: int) -> Tuple[int, int]:
+        """Добавляет события с id > min_id. Возвращает (сколько добавлено, max id)."""
+        rows = self.conn.execute(
+            "SELECT id, title, location, raw_text FROM events WHERE channel=? AND id > ? ORDER BY id",
+            (self.channel, min_id),
+        )
+        n, max_id = 0, min_id
+        for event_id, title, location, raw_text in rows:
+            for tok in search_tokens(f"{title or ''} {location or ''} {raw_text or ''}", self.stem):
+                # id растут (AUTOINCREMENT), поэтому списки остаются отсортированными
+                terms.setdefault(tok, []).append(event_id)
+            n += 1
+            max_id = event_id
+        return n, max_id
+
+    def export(self, force: bool = False) -> int:
+        with STATS.stage("search_index"):
+            return self._export(force)
+
+    def _export(self, force: bool) -> int:
+        inserts, mutations = db_events_revision(self.conn, self.channel)
+        saved = db_load_export_state(self.conn, self.channel, self.out_path)
+        if saved and saved.format != self.format_sig:
+            saved = None
+        prev = self._load() if saved else None
+
+        if not force and prev and saved[:2] == (inserts, mutations):
+            logging.debug("Search index skipped, no changes: %s", self.out_path)
+            return saved.events_count
+
+        if force or not prev or saved.mutations != mutations:
+            terms: Dict[str, List[int]] = {}
+            count, max_id = self._add_rows(terms, 0)
+        else:
+            terms = prev["terms"]
+            added, max_id = self._add_rows(terms, saved.max_id)
+            count = saved.events_count + added
+            max_id = max(max_id, saved.max_id)
+
+        index = {
+            "version": SEARCH_INDEX_VERSION,
+            "channel": self.channel,
+            "stem": self.stem,
+            "events_count": count,
+            "generated_at": now_iso(),
+            "terms": dict(sorted(terms.items())),
+        }
+        atomic_write_json(self.out_path, index, minify=True)
+        db_save_export_state(
+            self.conn, self.channel, self.out_path,
+            ExportState(inserts, mutations, max_id, count, self.format_sig),
+        )
+        return count
+
+
+# ---------- предсжатие статики ----------
+
+PRECOMPRESS_MANIFEST = "precompressed.json"
+PRECOMPRESS_SUFFIXES = (".json",)
+# только такие .gz/.br создаёт precompress_tree — и только их она вправе удалять
+PRECOMPRESS_VARIANTS = tuple(s + ext for s in PRECOMPRESS_SUFFIXES for ext in (".gz", ".br"))
+
+def _write_bytes_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def precompress_tree(root: str) -> Tuple[int, int]:
+    """
+    Кладёт рядом с каждым *.json в root (рекурсивно) .gz и, если есть модуль brotli, .br,
+    и ведёт root/precompressed.json: sha256, ETag и размеры по относительному пути.
+    Пересжимаются только файлы, чьё содержимое изменилось (по size+mtime, затем по sha256);
+    свои *.json.gz/*.json.br без исходника удаляются, чужие .gz/.br не трогаются. Без brotli
+    устаревший .br изменившегося файла удаляется, а не остаётся со старым содержимым.
+    Возвращает (пересжато, всего файлов).
+    """
+    manifest_path = os.path.join(root, PRECOMPRESS_MANIFEST)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            old = json.load(f).get("files", {})
+    except (OSError, ValueError):
+        old = {}
+
+    files: Dict[str, dict] = {}
+    changed = 0
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            if name.endswith(PRECOMPRESS_VARIANTS):
+                if not os.path.exists(path[:-3]):
+                    os.remove(path)
+                continue
+            if not name.endswith(PRECOMPRESS_SUFFIXES) or path == manifest_path:
+                continue
+
+            rel = os.path.relpath(path, root).replace(os.sep, "/")
+            st = os.stat(path)
+            prev = old.get(rel)
+            have_variants = os.path.exists(path + ".gz") and (brotli is None or os.path.exists(path + ".br"))
+            if prev and have_variants and prev["bytes"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+                files[rel] = prev
+                continue
+
+            with open(path, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            entry = {
+                "sha256": digest,
+                "etag": f'"{digest[:16]}"',
+                "bytes": len(data),
+                "mtime_ns": st.st_mtime_ns,
+            }
+            if prev and have_variants and prev["sha256"] == digest:
+                # файл переписан теми же байтами — сжатые варианты уже верные
+                entry.update({k: v for k, v in prev.items() if k in ("gzip_bytes", "br_bytes")})
+            else:
+                # mtime=0 — одинаковый вход даёт одинаковый .gz
+                gz = gzip.compress(data, compresslevel=9, mtime=0)
+                _write_bytes_atomic(path + ".gz", gz)
+                entry["gzip_bytes"] = len(gz)
+                if brotli is not None:
+                    br = brotli.compress(data, quality=11)
+                    _write_bytes_atomic(path + ".br", br)
+                    entry["br_bytes"] = len(br)
+                elif os.path.exists(path + ".br"):
+                    # сжат прошлой версией файла — brotli_static отдавал бы старое содержимое
+                    os.remove(path + ".br")
+                changed += 1
+            files[rel] = entry
+
+    if files != old:
+        atomic_write_json(manifest_path, {"generated_at": now_iso(), "files": dict(sorted(files.items()))})
+    return changed, len(files)
+
+
+@dataclass
+class ExportOptions:
+    # каталог шардов + manifest.json (None — без шардов)
+    shards_dir: Optional[str] = None
+    shard_by: str = "month"
+    # каталог со статикой, где после экспорта обновить .gz/.br (None — не сжимать)
+    precompress_dir: Optional[str] = None
+    # формат выгрузок (EXPORT_FORMATS); minify — events.json без отступов (шарды минифицированы всегда)
+    export_format: str = "full"
+    minify: bool = False
+    preview_chars: int = 0
+    # файл поискового индекса для страницы событий (None — не строить)
+    search_index: Optional[str] = None
+    search_stem: bool = True
+    # несколько каналов: у каждого свои файлы (channel_export_path), по заданным путям — общая выгрузка
+    per_channel: bool = False
+    # --export потоком (StreamingEventsExporter) вместо списка событий в памяти
+    stream: bool = False
+
+
+_export_options = ExportOptions()
+
+def channel_export_path(path: str, channel: str) -> str:
+    """events.json -> events.<channel>.json; каталог (шарды) -> каталог/<channel>."""
+    root, ext = os.path.splitext(path)
+    if ext:
+        return f"{root}.{channel}{ext}"
+    return os.path.join(path, channel)
+
+def set_export_options(**kwargs) -> ExportOptions:
+    global _export_options
+    _export_options = ExportOptions(**kwargs)
+    return _export_options
+
+
+class EventsPublisher:
+    """
+    Все выгрузки событий канала разом: полный JSON (EventsExporter, если задан out_path)
+    и то, что включено в ExportOptions (шарды). Экземпляр держит состояние экспортёров
+    между вызовами export() — режим update создаёт его один раз на запуск.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, channel: str, out_path: Optional[str]):
+        opts = _export_options
+        if opts.per_channel:
+            # сжатие — один раз после общей выгрузки (MergedEventsExporter), а не из потока каждого канала
+            out_path = channel_export_path(out_path, channel) if out_path else None
+            opts = replace(
+                opts,
+                shards_dir=channel_export_path(opts.shards_dir, channel) if opts.shards_dir else None,
+                search_index=channel_export_path(opts.search_index, channel) if opts.search_index else None,
+                precompress_dir=None,
+            )
+        if not out_path:
+            self.full = None
+        elif opts.stream:
+            self.full = StreamingEventsExporter(conn, [channel], out_path)
+        else:
+            self.full = EventsExporter(conn, channel, out_path, opts.export_format, opts.minify, opts.preview_chars)
+        self.sharded = (
+            ShardedEventsExporter(conn, channel, opts.shards_dir, opts.shard_by, opts.export_format, opts.preview_chars)
+            if opts.shards_dir else None
+        )
+        self.search = (
+            SearchIndexExporter(conn, channel, opts.search_index, opts.search_stem) if opts.search_index else None
+        )
+        self.precompress_dir = opts.precompress_dir
+        self.targets = ", ".join(t for t in (out_path, opts.shards_dir, opts.search_index) if t)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.full or self.sharded or self.search)
+
+    @property
+    def checkpoint_enabled(self) -> bool:
+        return bool(self.sharded)
+
+    def export(self, force: bool = False, checkpoint: bool = False) -> int:
+        """
+        checkpoint=True — промежуточная выгрузка посреди запуска: только шарды, у них стоимость
+        O(новых событий). Единый файл и поисковый индекс каждый раз переписываются целиком,
+        поэтому они пишутся в конце запуска (и при прерывании — из main).
+        """
+        cnt = 0
+        if self.full and not checkpoint:
+            cnt = self.full.export(force)
+        if self.sharded:
+            cnt = self.sharded.export(force)
+        if self.search and not checkpoint:
+            self.search.export(force)
+        if self.precompress_dir:
+            with STATS.stage("compress"):
+                changed, total = precompress_tree(self.precompress_dir)
+            logging.debug("Precompressed %d of %d files in %s", changed, total, self.precompress_dir)
+        return cnt
+
+
+def export_events_json(conn: sqlite3.Connection, channel: str, out_path: Optional[str]) -> int:
+    return EventsPublisher(conn, channel, out_path).export()
+
+
+class MergedEventsExporter:
+    """
+    Общая выгрузка событий нескольких каналов в формате full (канал — в каждом событии).
+    Пропускается, если суммарная ревизия каналов не изменилась; иначе — полный пересбор.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, channels: List[str], out_path: str, minify: bool = False):
+        self.conn = conn
+        self.channels = sorted(channels)
+        self.out_path = out_path
+        self.minify = minify
+        # строка export_state на набор каналов
+        self.state_key = "+".join(self.channels)
+
+    def export(self, force: bool = False) -> int:
+        with STATS.stage("export"):
+            return self._export(force)
+
+    def _export(self, force: bool) -> int:
+        inserts = mutations = 0
+        for ch in self.channels:
+            i, m = db_events_revision(self.conn, ch)
+            inserts, mutations = inserts + i, mutations + m
+
+        saved = db_load_export_state(self.conn, self.state_key, self.out_path)
+        if not force and saved and (saved.inserts, saved.mutations) == (inserts, mutations) and os.path.exists(self.out_path):
+            logging.debug("Merged export skipped, no changes since last export: %s", self.out_path)
+            return saved.events_count
+
+        rows = self.conn.execute(
+            f"""
+            SELECT id, {", ".join(EXPORT_COLUMNS)}
+            FROM events
+            WHERE channel IN ({",".join("?" * len(self.channels))})
+            """,
+            self.channels,
+        )
+        keyed = []
+        max_id = 0
+        texts: Dict[Tuple[str, int], str] = {}
+        for r in rows:
+            ev = {"id": r[0], **dict(zip(EXPORT_COLUMNS, r[1:]))}
+            ev["raw_text"] = share_text(texts, (ev["channel"], ev["source_post_id"]), ev["raw_text"])
+            keyed.append((_export_sort_key(ev, r[0]), ev))
+            max_id = max(max_id, r[0])
+        keyed.sort(key=lambda kv: kv[0])
+        events = [ev for _, ev in keyed]
+
+        payload = {
+            "channels": self.channels,
+            "events_count": len(events),
+            "generated_at": now_iso(),
+            "events": events,
+        }
+        atomic_write_json(self.out_path, payload, minify=self.minify)
+        db_save_export_state(
+            self.conn, self.state_key, self.out_path,
+            ExportState(inserts, mutations, max_id, len(events), "full"),
+        )
+        return len(events)
+
+
+def export_channels(conn: sqlite3.Connection, channels: List[str], out_path: Optional[str]) -> int:
+    """
+    Выгрузки для одного или нескольких каналов. Для нескольких — файлы каждого канала
+    (пути по channel_export_path) и общая выгрузка по out_path; возвращает число событий в общей.
+    """
+    if len(channels) == 1:
+        return export_events_json(conn, channels[0], out_path)
+
+    for ch in channels:
+        EventsPublisher(conn, ch, out_path).export()
+    cnt = 0
+    if out_path and _export_options.stream:
+        cnt = StreamingEventsExporter(conn, channels, out_path).export()
+    elif out_path:
+        cnt = MergedEventsExporter(conn, channels, out_path, minify=_export_options.minify).export()
+    if _export_options.precompress_dir:
+        with STATS.stage("compress"):
+            precompress_tree(_export_options.precompress_dir)
+    return cnt
+
+
+# ---------- режимы скачивания ----------
+
+class CacheMiss(Exception):
+    """Страницы нет в кэше, а сеть запрещена (--offline)."""
+
+
+class PageCache:
+    """
+    Кэш скачанного HTML на диске, адресуемый по содержимому:
+      objects/ab/<sha1 содержимого>.html.gz — сами страницы (одинаковые хранятся один раз);
+      index/<sha1 url>.json                 — url -> sha1 содержимого + ETag/Last-Modified.
+    Запись атомарная (tmp + os.replace), можно пользоваться из нескольких потоков.
+    """
+
+    def __init__(self, root: str, offline: bool = False):
+        self.root = root
+        self.offline = offline
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "index"), exist_ok=True)
+
+    def _index_path(self, url: str) -> str:
+        return os.path.join(self.root, "index", f"{sha1(url)}.json")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.html.gz")
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def lookup(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._index_path(url), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if os.path.exists(self._object_path(entry["sha1"])) else None
+
+    def read(self, entry: dict) -> str:
+        with gzip.open(self._object_path(entry["sha1"]), "rt", encoding="utf-8") as f:
+            return f.read()
+
+    def store(self, url: str, html: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        digest = sha1(html)
+        obj = self._object_path(digest)
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            self._write_atomic(obj, gzip.compress(html.encode("utf-8")))
+        entry = {
+            "url": url,
+            "sha1": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": now_iso(),
+        }
+        self._write_atomic(self._index_path(url), json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    def conditional_headers(self, entry: Optional[dict]) -> Dict[str, str]:
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+class CrawlSession(requests.Session):
+    """requests.Session + общие для всех запросов запуска настройки краулера."""
+
+    def __init__(
+        self,
+        page_cache: Optional[PageCache] = None,
+        rate_controller: Optional[AdaptiveRateController] = None,
+    ):
+        super().__init__()
+        self.page_cache = page_cache
+        self.rate_controller = rate_controller
+
+
+def make_session(
+    pool_size: int = 10,
+    page_cache: Optional[PageCache] = None,
+    rate_controller: Optional[AdaptiveRateController] = None,
+) -> CrawlSession:
+    s = CrawlSession(page_cache=page_cache, rate_controller=rate_controller)
+    s.headers.update(
+        {
+            "User-Agent": "Mozilla/5.0 (compatible; tg-events-parser/2.0; +https://t.me)",
+            "Accept-Language": "ru,en;q=0.8",
+        }
+    )
+    # пул соединений должен вмещать все одновременные запросы asyncio-движка
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+# откуда качать страницы; канонические ссылки на посты (post_url) всегда https://t.me/...
+_base_url = "https://t.me"
+
+def set_base_url(url: str) -> str:
+    """Например, http://127.0.0.1:8080 для tools/fake_telegram.py."""
+    global _base_url
+    _base_url = url.rstrip("/")
+    return _base_url
+
+def feed_page_url(channel: str, before: Optional[int]) -> str:
+    base = f"{_base_url}/s/{channel}"
+    return base if before is None else f"{base}?before={before}"
+
+def single_post_url(channel: str, post_id: int) -> str:
+    # Страница конкретного поста (публичная)
+    return f"{_base_url}/{channel}/{post_id}"
+
+def fetch_html(session: requests.Session, url: str) -> str:
+    """
+    GET страницы через кэш, если он включён: с If-None-Match/If-Modified-Since,
+    при 304 — HTML из кэша. В режиме offline сеть не трогается вовсе.
+    """
+    cache: Optional[PageCache] = getattr(session, "page_cache", None)
+    STATS.count("pages")
+    if cache is None:
+        return get_with_retries(session, url=url).text
+
+    entry = cache.lookup(url)
+    if cache.offline:
+        if entry is None:
+            raise CacheMiss(url)
+        STATS.count("cache_hits")
+        return cache.read(entry)
+
+    resp = get_with_retries(session, url=url, headers=cache.conditional_headers(entry))
+    if resp.status_code == 304 and entry is not None:
+        logging.debug("304 Not Modified, served from cache: %s", url)
+        STATS.count("cache_hits")
+        return cache.read(entry)
+
+    cache.store(url, resp.text, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+    return resp.text
+
+def fetch_feed_page(session: requests.Session, channel: str, before: Optional[int]) -> str:
+    return fetch_html(session, feed_page_url(channel, before))
+
+def fetch_single_post(session: requests.Session, channel: str, post_id: int) -> str:
+    return fetch_html(session, single_post_url(channel, post_id))
+
+
+# ---------- asyncio-движок скачивания ----------
+
+class HostRateLimiter:
+    """
+    Ограничение частоты запросов: не больше `rate` запросов в секунду на один хост.
+    Потокобезопасный, слоты раздаются по очереди.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, url: str) -> float:
+        """Занимает ближайший слот для хоста url и возвращает, сколько секунд до него ждать."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_at.get(host, 0.0))
+            self._next_at[host] = slot + self.interval
+        return slot - now
+
+
+class AsyncFetchEngine:
+    """
+    Event loop в фоновом потоке: одновременно не больше `concurrency` запросов,
+    частота ограничена HostRateLimiter (или AdaptiveRateController сессии, если он есть). Сами запросы — те же fetch_* (через
+    asyncio.to_thread), поэтому ретраи/бэкофф get_with_retries сохраняются.
+    Парсинг и запись в SQLite остаются в вызывающем потоке: submit_* возвращают
+    concurrent.futures.Future с HTML.
+    """
+
+    def __init__(self, session: requests.Session, concurrency: int = 4, rate: float = 2.0):
+        self.concurrency = max(1, concurrency)
+        self.session = session
+        # у сессии с контроллером темп держит get_with_retries, второй лимит не нужен
+        self.limiter = None if getattr(session, "rate_controller", None) else HostRateLimiter(rate)
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fetch-loop", daemon=True)
+        self._thread.start()
+        self._pending: set = set()
+
+    async def _run(self, url: str, fn: Callable[..., str], *args) -> str:
+        async with self._sem:
+            delay = self.limiter.reserve(url) if self.limiter else 0.0
+            if delay > 0:
+                STATS.count("sleep_s", delay)
+                await asyncio.sleep(delay)
+            return await asyncio.to_thread(fn, self.session, *args)
+
+    def _submit(self, url: str, fn: Callable[..., str], *args) -> Future:
+        fut = asyncio.run_coroutine_threadsafe(self._run(url, fn, *args), self._loop)
+        self._pending.add(fut)
+        fut.add_done_callback(self._pending.discard)
+        return fut
+
+    def submit_feed_page(self, channel: str, before: Optional[int]) -> Future:
+        return self._submit(feed_page_url(channel, before), fetch_feed_page, channel, before)
+
+    def submit_single_post(self, channel: str, post_id: int) -> Future:
+        return self._submit(single_post_url(channel, post_id), fetch_single_post, channel, post_id)
+
+    def close(self) -> None:
+        for fut in list(self._pending):
+            fut.cancel()
+        # дождаться запросов, уже ушедших в потоки
+        asyncio.run_coroutine_threadsafe(self._loop.shutdown_default_executor(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def __enter__(self) -> "AsyncFetchEngine":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def iter_prefetched(items: Iterable, submit: Callable[..., Future], window: int) -> Iterator[Tuple[object, Future]]:
+    """
+    Отдаёт (item, future) в исходном порядке, держа в полёте не больше window запросов вперёд.
+    """
+    it = iter(items)
+    queue: deque = deque()
+    for item in it:
+        queue.append((item, submit(item)))
+        if len(queue) >= window:
+            break
+    while queue:
+        item, fut = queue.popleft()
+        for nxt in it:
+            queue.append((nxt, submit(nxt)))
+            break
+        yield item, fut
+
+def queue_post(writer: DbWriter, p: TelegramPost) -> None:
+    """Классификация поста и извлечение событий; пост и события — в очередь writer."""
+    try:
+        with STATS.stage("classify"):
+            keywords = scan_keywords(p.text)
+            hints = match_event_hints(p.text, keywords)
+        writer.add_post(p, hints)
+
+        if hints:
+            logging.debug("post_id=%d is eventish: %s", p.post_id, ", ".join(hints))
+            with STATS.stage("extract"):
+                events = extract_events_from_post(p, keywords)
+            STATS.count("events", len(events))
+            for ev in events:
+                writer.add_event(ev)
+
+    except Exception as e:
+        logging.exception("Error processing post %s: %s", p.post_url, e)
+        # продолжаем: пост, если успел, уже в очереди на запись
+
+def recheck_post(writer: DbWriter, p: TelegramPost, stored: Tuple[Optional[str], Optional[str]]) -> bool:
+    """Сравнивает свежий пост с сохранённым (text_hash, links_json); изменённый — в writer.update_post."""
+    row = post_row(p)
+    if (row[6], row[5]) == stored:
+        return False
+    logging.info("post_id=%d was edited, re-extracting events", p.post_id)
+    STATS.count("edited_posts")
+    with STATS.stage("classify"):
+        keywords = scan_keywords(p.text)
+        hints = match_event_hints(p.text, keywords)
+    events: List[Event] = []
+    if hints:
+        with STATS.stage("extract"):
+            try:
+                events = extract_events_from_post(p, keywords)
+            except Exception as e:
+                # старые события не трогаем, если новые извлечь не удалось
+                logging.exception("Error processing edited post %s: %s", p.post_url, e)
+                return False
+    writer.update_post(p, hints, events)
+    return True
+
+def append_jsonl(path: str, obj: dict) -> None:
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
 
-    do_checkpoint()
+
+def run_update_mode(
+    conn: sqlite3.Connection,
+    channel: str,
+    max_pages: int,
+    max_posts: int,
+    stop_after_known: int,
+    sleep_sec: float,
+    checkpoint_every: int,
+    export_path: Optional[str],
+    checkpoint_path: Optional[str],
+    events_jsonl: Optional[str],
+    engine: Optional[AsyncFetchEngine] = None,
+    batch_size: int = 200,
+    session: Optional[requests.Session] = None,
+    start_before: Optional[int] = None,
+    state_mode: str = "update",
+    recheck_last: int = 0,
+    recheck_days: float = 0.0,
+) -> bool:
+    """
+    Идёт по ленте от курсора start_before (None — с самой свежей страницы) к старым постам.
+    stop_after_known <= 0 — не останавливаться на известных постах. Курсор следующей
+    страницы сохраняется в channel_state(channel, state_mode) после записи каждой страницы.
+    recheck_last/recheck_days — окно перепроверки: известные посты из последних N / за D дней
+    сравниваются с сохранёнными (text_hash и ссылки), изменённые перезаписываются вместе с событиями;
+    такие посты не считаются в stop_after_known.
+    Возвращает True, если лента кончилась (дошли до первого поста канала).
+    """
+    session = engine.session if engine else (session or make_session())
+    writer = DbWriter(conn, batch_size=batch_size)
+    publisher = EventsPublisher(conn, channel, export_path)
+    recheck_from_id = db_recheck_from_id(conn, channel, recheck_last, recheck_days)
+    if recheck_from_id is not None:
+        logging.info("Recheck window: known posts with id >= %d are compared for edits", recheck_from_id)
+
+    before = start_before
+    pages = 0
+    processed_posts = 0
+    inserted_posts = 0
+    inserted_events = 0
+    known_streak = 0
+    checkpointed_at = 0  # inserted_posts + inserted_events на момент последнего чекпоинта
+
+    # asyncio-движок: страницы ленты качаются наперёд по предсказанным курсорам
+    prefetched: Dict[Optional[int], Future] = {}
+    seen_ids: set = set()
+
+    def flush_writes():
+        nonlocal inserted_posts, inserted_events
+        for ev in writer.flush():
+            if events_jsonl:
+                append_jsonl(events_jsonl, asdict(ev))
+        inserted_posts, inserted_events = writer.inserted_posts, writer.inserted_events
+
+    def do_checkpoint(final: bool = False):
+        nonlocal checkpoint_path, checkpointed_at
+        # сначала всё накопленное — в БД, потом курсор в checkpoint.json
+        flush_writes()
+        checkpointed_at = inserted_posts + inserted_events
+        state = {
+            "channel": channel,
+            "mode": state_mode,
+            "before": before,
+            "pages": pages,
+            "processed_posts": processed_posts,
+            "inserted_posts": inserted_posts,
+            "inserted_events": inserted_events,
+            "known_streak": known_streak,
+            "updated_at": now_iso(),
+        }
+        db_save_channel_state(conn, channel, state_mode, state)
+        if checkpoint_path:
+            atomic_write_json(checkpoint_path, {**state, "stats": STATS.summary()})
+        if final and publisher.enabled:
+            cnt = publisher.export()
+            logging.info("Export: %s events -> %s", cnt, publisher.targets)
+        elif publisher.checkpoint_enabled:
+            cnt = publisher.export(checkpoint=True)
+            logging.info("Checkpoint export: %s events -> %s", cnt, publisher.sharded.out_dir)
+
+    def maybe_checkpoint():
+        flush_writes()
+        if checkpoint_every > 0 and inserted_posts + inserted_events - checkpointed_at >= checkpoint_every:
+            do_checkpoint()
+
+    def finish():
+        # страницы, скачанные наперёд, больше не нужны
+        for fut in prefetched.values():
+            fut.cancel()
+        prefetched.clear()
+        do_checkpoint(final=True)
+        if writer.updated_posts:
+            logging.info(
+                "Edited posts: %d updated; events +%d ~%d -%d",
+                writer.updated_posts, *writer.replaced_events,
+            )
+
+    def get_page(cursor: Optional[int]) -> str:
+        if engine is None:
+            return fetch_feed_page(session, channel, before=cursor)
+        fut = prefetched.pop(cursor, None) or engine.submit_feed_page(channel, cursor)
+        return fut.result()
+
+    def prefetch(cursor: int, step: int) -> None:
+        """
+        Ставит в очередь следующие страницы: cursor, cursor-step, ...
+        Страница before=X содержит step постов с id < X, поэтому курсоры через step
+        не оставляют пропусков (удалённые посты дают лишь перекрытие, его отсекает seen_ids).
+        """
+        ahead = min(engine.concurrency, max_pages - pages)
+        for k in range(ahead):
+            c = cursor - k * step
+            if c <= 1:
+                break
+            if c not in prefetched:
+                prefetched[c] = engine.submit_feed_page(channel, c)
+
+    while pages < max_pages and processed_posts < max_posts:
+        try:
+            html = get_page(before)
+        except CacheMiss:
+            logging.info("Offline: feed page (before=%s) is not cached, stopping.", before)
+            finish()
+            return False
+        except Exception as e:
+            logging.exception("Failed to fetch feed page (before=%s): %s", before, e)
+            finish()
+            return False
+
+        with STATS.stage("parse_html"):
+            posts = parse_posts_from_html(html, channel)
+        STATS.count("posts", len(posts))
+        if not posts:
+            # пустой ответ, заглушка/капча или другая вёрстка — не повод считать ленту закончившейся
+            logging.warning("No posts found on page (before=%s), stopping.", before)
+            finish()
+            return False
+
+        pages += 1
+
+        # pagination: следующий курсор считаем сразу, чтобы качать наперёд во время обработки
+        min_id = min(p.post_id for p in posts)
+        next_before = min_id
+        if engine is not None and before is not None:
+            predicted = before - len(posts)
+            if min_id not in prefetched and predicted >= min_id and predicted in prefetched:
+                next_before = predicted
+        if engine is not None and next_before != before:
+            prefetch(next_before, len(posts))
+
+        posts = [p for p in posts if p.post_id not in seen_ids]
+        seen_ids.update(p.post_id for p in posts)
+
+        ids = [p.post_id for p in posts]
+        if recheck_from_id is None:
+            existing = db_existing_post_ids(conn, channel, ids)
+        else:
+            existing = db_post_fingerprints(conn, channel, ids)
+
+        # Новые -> старые
+        for p in posts:
+            if processed_posts >= max_posts:
+                break
+
+            processed_posts += 1
+
+            if p.post_id in existing:
+                if recheck_from_id is not None and p.post_id >= recheck_from_id:
+                    recheck_post(writer, p, existing[p.post_id])
+                    continue
+                known_streak += 1
+                # если долго подряд встречаем уже известные, значит догнали “хвост”
+                if 0 < stop_after_known <= known_streak:
+                    logging.info("Stop condition reached: %d known posts in a row.", known_streak)
+                    finish()
+                    return False
+                continue
+
+            # Это новый пост
+            known_streak = 0
+            queue_post(writer, p)
+
+            if writer.full:
+                maybe_checkpoint()
+
+        # одна транзакция на страницу
+        maybe_checkpoint()
+
+        if before == next_before:
+            logging.info("Pagination stuck (before repeats), stopping.")
+            finish()
+            return False
+        before = next_before
+        if next_before <= 1 or not feed_has_older(html):
+            # старше поста №1 ничего нет; на последней странице нет и ссылки на более старые
+            logging.info("Reached the first post of the channel.")
+            finish()
+            return True
+        # курсор следующей страницы: после перезапуска эта страница не качается повторно
+        db_save_channel_state(conn, channel, state_mode, {
+            "channel": channel, "mode": state_mode, "before": before, "pages": pages,
+            "inserted_posts": inserted_posts, "inserted_events": inserted_events, "updated_at": now_iso(),
+        })
+
+        if engine is None:
+            pause(sleep_sec)
+
+    finish()
+    return False
+
+
+def run_backfill_mode(
+    conn: sqlite3.Connection,
+    channel: str,
+    max_pages: int,
+    restart: bool = False,
+    **update_kwargs,
+) -> bool:
+    """
+    Догрузка истории канала вглубь, по max_pages страниц за запуск. Курсор хранится
+    в channel_state(channel, "backfill") отдельно от обычного обновления, поэтому оба режима
+    можно запускать независимо (и одновременно — разными процессами). Первый запуск начинает
+    со старейшего поста в базе: свежие страницы уже прошло обычное обновление.
+    Возвращает True, когда история скачана до первого поста.
+    """
+    state = None if restart else db_load_channel_state(conn, channel, "backfill")
+    if state and state.get("done"):
+        logging.info("Backfill of %s is complete (%s), nothing to do.", channel, state.get("finished_at"))
+        return True
+
+    if state and state.get("before"):
+        cursor = state["before"]
+    else:
+        cursor, _ = db_min_max_post_id(conn, channel)
+    logging.info("Backfill %s: resuming before=%s, up to %d pages", channel, cursor, max_pages)
+
+    done = run_update_mode(
+        conn=conn,
+        channel=channel,
+        max_pages=max_pages,
+        # бюджет запуска — страницы: недоразобранная страница не должна остаться за курсором
+        max_posts=sys.maxsize,
+        # известные посты (например, из --fetch-ids) пропускаются, но не останавливают проход
+        stop_after_known=0,
+        start_before=cursor,
+        state_mode="backfill",
+        **update_kwargs,
+    )
+    if done:
+        state = db_load_channel_state(conn, channel, "backfill") or {}
+        db_save_channel_state(conn, channel, "backfill", {**state, "done": True, "finished_at": now_iso()})
+        logging.info("Backfill of %s reached the first post.", channel)
+    return done
+
+
+def db_plan_partitions(conn: sqlite3.Connection, channel: str, newest_id: int, size: int) -> int:
+    """Делит [1, newest_id] на диапазоны по size id (сверху вниз). Уже нарезанные не трогает."""
+    rows = []
+    hi = newest_id
+    while hi >= 1:
+        lo = max(1, hi - size + 1)
+        rows.append((channel, lo, hi, hi + 1, now_iso()))
+        hi = lo - 1
+    with conn:
+        cur = conn.executemany(
+            "INSERT OR IGNORE INTO backfill_partitions(channel, lo, hi, cursor, updated_at) VALUES(?,?,?,?,?)",
+            rows,
+        )
+    return cur.rowcount
+
+def db_pending_partitions(conn: sqlite3.Connection, channel: str) -> List[Tuple[int, int, int]]:
+    """(lo, hi, cursor) недокачанных диапазонов, начиная с самых свежих."""
+    return conn.execute(
+        "SELECT lo, hi, cursor FROM backfill_partitions WHERE channel=? AND status != 'done' ORDER BY lo DESC",
+        (channel,),
+    ).fetchall()
+
+def db_update_partition(conn: sqlite3.Connection, channel: str, lo: int, cursor: int, pages: int, status: str) -> None:
+    with conn:
+        conn.execute(
+            "UPDATE backfill_partitions SET cursor=?, pages=pages+?, status=?, updated_at=? WHERE channel=? AND lo=?",
+            (cursor, pages, status, now_iso(), channel, lo),
+        )
+
+
+def crawl_partition(
+    db_path: str,
+    session: requests.Session,
+    channel: str,
+    lo: int,
+    cursor: int,
+    sleep_sec: float,
+    batch_size: int,
+    events_jsonl: Optional[str],
+    stop: threading.Event,
+) -> Tuple[int, int]:
+    """
+    Качает ленту от ?before=cursor вниз до lo. Перед каждой страницей курсор опускается
+    до верхней дыры в [lo, cursor-1] (db_gap_ranges): уже скачанное обычным обновлением
+    или прошлыми запусками не запрашивается повторно. После каждой страницы пишет посты
+    и курсор. Возвращает (страниц, новых постов).
+    """
+    conn = db_connect(db_path)
+    writer = DbWriter(conn, batch_size=batch_size)
+    pages = 0
+    try:
+        while not stop.is_set():
+            gaps = list(db_gap_ranges(conn, channel, lo, cursor - 1))
+            if not gaps:
+                db_update_partition(conn, channel, lo, lo, 0, "done")
+                break
+            cursor = gaps[-1][1] + 1
+
+            html = fetch_feed_page(session, channel, before=cursor)
+            with STATS.stage("parse_html"):
+                posts = parse_posts_from_html(html, channel)
+            STATS.count("posts", len(posts))
+            pages += 1
+            if not posts:
+                # курсор не двигаем: диапазон докачается со следующего запуска
+                logging.warning("Backfill: no posts on page (before=%d), partition %d.. left for the next run", cursor, lo)
+                break
+
+            existing = db_existing_post_ids(conn, channel, [p.post_id for p in posts])
+            for p in posts:
+                if p.post_id not in existing:
+                    queue_post(writer, p)
+            for ev in writer.flush():
+                if events_jsonl:
+                    append_jsonl(events_jsonl, asdict(ev))
+
+            min_id = min(p.post_id for p in posts)
+            if min_id <= lo or not feed_has_older(html):
+                # дошли до нижней границы диапазона или до начала канала
+                db_update_partition(conn, channel, lo, lo, 1, "done")
+                break
+            cursor = min_id
+            db_update_partition(conn, channel, lo, cursor, 1, "running")
+            pause(sleep_sec)
+    finally:
+        conn.close()
+    return pages, writer.inserted_posts
+
+
+def run_partitioned_backfill_mode(
+    db_path: str,
+    channel: str,
+    session: requests.Session,
+    workers: int,
+    partition_size: int,
+    restart: bool,
+    sleep_sec: float,
+    batch_size: int,
+    export_path: Optional[str],
+    events_jsonl: Optional[str],
+) -> bool:
+    """
+    Догрузка истории параллельно: [1, newest_id] режется на диапазоны id (посты канала
+    нумеруются подряд, а ?before= позволяет начать с любого места), диапазоны качаются
+    workers потоками через общую сессию — темп запросов на хост общий. Прогресс диапазонов —
+    в backfill_partitions, прерванный запуск продолжается с сохранённых курсоров.
+    Возвращает True, если все диапазоны докачаны.
+    """
+    conn = db_connect(db_path)
+    try:
+        if restart:
+            with conn:
+                conn.execute("DELETE FROM backfill_partitions WHERE channel=?", (channel,))
+
+        pending = db_pending_partitions(conn, channel)
+        if not pending and not conn.execute(
+            "SELECT 1 FROM backfill_partitions WHERE channel=? LIMIT 1", (channel,)
+        ).fetchone():
+            _, newest_id = db_min_max_post_id(conn, channel)
+            if newest_id is None:
+                posts = parse_posts_from_html(fetch_feed_page(session, channel, before=None), channel)
+                newest_id = max((p.post_id for p in posts), default=0)
+            created = db_plan_partitions(conn, channel, newest_id, partition_size)
+            logging.info("Backfill %s: ids 1..%d split into %d partitions of %d", channel, newest_id, created, partition_size)
+            pending = db_pending_partitions(conn, channel)
+
+        if not pending:
+            logging.info("Backfill of %s is complete, nothing to do.", channel)
+            return True
+        logging.info("Backfill %s: %d partitions left, %d workers", channel, len(pending), workers)
+
+        stop = threading.Event()
+        pages = posts = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(crawl_partition, db_path, session, channel, lo, cursor,
+                            sleep_sec, batch_size, events_jsonl, stop)
+                for lo, hi, cursor in pending
+            ]
+            try:
+                for fut in futures:
+                    try:
+                        n_pages, n_posts = fut.result()
+                        pages, posts = pages + n_pages, posts + n_posts
+                    except Exception as e:
+                        # курсор диапазона сохранён, следующий запуск продолжит с него
+                        failed += 1
+                        logging.exception("Backfill partition failed: %s", e)
+            except KeyboardInterrupt:
+                # потоки доделывают текущую страницу и выходят
+                stop.set()
+                raise
+
+        left = len(db_pending_partitions(conn, channel))
+        logging.info("Backfill %s: %d pages, %d new posts, %d partitions left", channel, pages, posts, left)
+        publisher = EventsPublisher(conn, channel, export_path)
+        if publisher.enabled:
+            cnt = publisher.export()
+            logging.info("Exported %d events -> %s", cnt, publisher.targets)
+        return left == 0 and not failed
+    finally:
+        conn.close()
 
 
 def run_fetch_ids_mode(
@@ -687,18 +2914,41 @@ def run_fetch_ids_mode(
     sleep_sec: float,
     export_path: Optional[str],
     events_jsonl: Optional[str],
+    engine: Optional[AsyncFetchEngine] = None,
+    batch_size: int = 200,
+    session: Optional[requests.Session] = None,
 ) -> None:
-    session = make_session()
+    session = engine.session if engine else (session or make_session())
+    writer = DbWriter(conn, batch_size=batch_size)
+
+    def flush_writes():
+        for ev in writer.flush():
+            if events_jsonl:
+                append_jsonl(events_jsonl, asdict(ev))
 
+    todo: List[Tuple[int, int]] = []
     for i, pid in enumerate(ids, 1):
         # если уже есть — не трогаем
         if db_existing_post_ids(conn, channel, [pid]):
             logging.info("[%d/%d] post_id=%d already in DB, skip", i, len(ids), pid)
             continue
+        todo.append((i, pid))
 
+    if engine is not None:
+        jobs = iter_prefetched(
+            todo,
+            lambda item: engine.submit_single_post(channel, item[1]),
+            window=engine.concurrency * 2,
+        )
+    else:
+        jobs = ((item, None) for item in todo)
+
+    for (i, pid), fut in jobs:
         try:
-            html = fetch_single_post(session, channel, pid)
-            posts = parse_posts_from_html(html, channel)
+            html = fut.result() if fut is not None else fetch_single_post(session, channel, pid)
+            with STATS.stage("parse_html"):
+                posts = parse_posts_from_html(html, channel)
+            STATS.count("posts", len(posts))
             # На странице конкретного поста обычно будет ровно 1
             post = None
             for p in posts:
@@ -708,38 +2958,44 @@ def run_fetch_ids_mode(
 
             if not post:
                 # Может быть удалён или недоступен, но сервер вернул страницу без контента
-                db_mark_missing(conn, channel, pid, status="not_found", note="No tgme_widget_message for this id")
+                writer.mark_missing(channel, pid, status="not_found", note="No tgme_widget_message for this id")
                 logging.warning("post_id=%d not parsed (maybe deleted)", pid)
                 continue
 
-            db_insert_post(conn, post)
-
-            if is_eventish_post(post.text):
-                for ev in extract_events_from_post(post):
-                    if db_insert_event(conn, ev) and events_jsonl:
-                        append_jsonl(events_jsonl, ev.__dict__)
-
+            queue_post(writer, post)
             logging.info("[%d/%d] OK post_id=%d", i, len(ids), pid)
 
+        except CacheMiss:
+            # офлайн: не знаем, что с постом, — ничего не помечаем
+            logging.info("[%d/%d] post_id=%d is not cached, skip", i, len(ids), pid)
+
         except requests.HTTPError as e:
             code = getattr(e.response, "status_code", None)
             if code == 404:
-                db_mark_missing(conn, channel, pid, status="not_found", note="HTTP 404")
+                writer.mark_missing(channel, pid, status="not_found", note="HTTP 404")
             elif code == 403:
-                db_mark_missing(conn, channel, pid, status="forbidden", note="HTTP 403")
+                writer.mark_missing(channel, pid, status="forbidden", note="HTTP 403")
             else:
-                db_mark_missing(conn, channel, pid, status="http_error", note=f"HTTP {code}")
+                writer.mark_missing(channel, pid, status="http_error", note=f"HTTP {code}")
             logging.warning("post_id=%d HTTP error: %s", pid, e)
 
         except Exception as e:
-            db_mark_missing(conn, channel, pid, status="error", note=str(e)[:200])
+            writer.mark_missing(channel, pid, status="error", note=str(e)[:200])
             logging.exception("post_id=%d failed: %s", pid, e)
 
-        time.sleep(sleep_sec)
+        finally:
+            if writer.full:
+                flush_writes()
+
+        if fut is None:
+            pause(sleep_sec)
 
-    if export_path:
-        cnt = export_events_json(conn, channel, export_path)
-        logging.info("Exported %d events -> %s", cnt, export_path)
+    flush_writes()
+
+    publisher = EventsPublisher(conn, channel, export_path)
+    if publisher.enabled:
+        cnt = publisher.export()
+        logging.info("Exported %d events -> %s", cnt, publisher.targets)
 
 
 def run_repair_missing_mode(
@@ -749,6 +3005,9 @@ def run_repair_missing_mode(
     sleep_sec: float,
     export_path: Optional[str],
     events_jsonl: Optional[str],
+    engine: Optional[AsyncFetchEngine] = None,
+    batch_size: int = 200,
+    session: Optional[requests.Session] = None,
 ) -> None:
     mn, mx = db_min_max_post_id(conn, channel)
     if mn is None or mx is None:
@@ -761,7 +3020,556 @@ def run_repair_missing_mode(
         return
 
     logging.info("Repair missing: will fetch %d ids in range [%d..%d]", len(missing), mn, mx)
-    run_fetch_ids_mode(conn, channel, missing, sleep_sec=sleep_sec, export_path=export_path, events_jsonl=events_jsonl)
+    run_fetch_ids_mode(
+        conn, channel, missing,
+        sleep_sec=sleep_sec,
+        export_path=export_path,
+        events_jsonl=events_jsonl,
+        engine=engine,
+        batch_size=batch_size,
+        session=session,
+    )
+
+
+# ---------- режим наблюдения (--watch) ----------
+
+def db_typical_post_gap(conn: sqlite3.Connection, channel: str, sample: int = 30) -> Optional[float]:
+    """Медиана промежутков между последними sample постами канала, в секундах (None — мало данных)."""
+    rows = conn.execute(
+        "SELECT published_at FROM posts WHERE channel=? AND published_at IS NOT NULL ORDER BY post_id DESC LIMIT ?",
+        (channel, sample),
+    ).fetchall()
+    stamps = []
+    for (ts,) in rows:
+        try:
+            stamps.append(datetime.fromisoformat(ts).timestamp())
+        except ValueError:
+            continue
+    stamps.sort()
+    gaps = sorted(b - a for a, b in zip(stamps, stamps[1:]) if b > a)
+    if not gaps:
+        return None
+    return gaps[len(gaps) // 2]
+
+
+class PollScheduler:
+    """
+    Интервал опроса ленты в --watch. После опроса с новыми постами — min_interval
+    (за одним постом часто идёт следующий), каждый пустой опрос растягивает интервал
+    в backoff раз до потолка. Потолок — четверть типичного промежутка между постами
+    канала, но в пределах [min_interval, max_interval]: редко пишущий канал
+    опрашивается редко. Ошибки сети удваивают интервал вплоть до max_interval.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 1.5, jitter: float = 0.1):
+        self.min_interval = max(1.0, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.backoff = backoff
+        self.jitter = jitter
+        self.ceiling = self.max_interval
+        self.interval = self.min_interval
+
+    def set_cadence(self, gap_s: Optional[float]) -> None:
+        self.ceiling = self.max_interval if gap_s is None else min(self.max_interval, max(self.min_interval, gap_s / 4))
+        self.interval = min(self.interval, self.ceiling)
+
+    def on_poll(self, new_posts: int) -> float:
+        if new_posts:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.ceiling, self.interval * self.backoff)
+        return self._jittered()
+
+    def on_error(self) -> float:
+        self.interval = min(self.max_interval, self.interval * 2)
+        return self._jittered()
+
+    def _jittered(self) -> float:
+        # разброс, чтобы несколько наблюдателей не синхронизировались
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+def poll_new_posts(
+    conn: sqlite3.Connection,
+    session: requests.Session,
+    channel: str,
+    writer: DbWriter,
+    max_pages: int,
+    sleep_sec: float,
+) -> int:
+    """
+    Скачивает ленту с самой свежей страницы до первого уже известного поста
+    (не дальше max_pages страниц) и ставит новые посты и события в writer.
+    Возвращает число новых постов.
+    """
+    before = None
+    new_posts = 0
+    for page in range(max_pages):
+        html = fetch_feed_page(session, channel, before=before)
+        with STATS.stage("parse_html"):
+            posts = parse_posts_from_html(html, channel)
+        STATS.count("posts", len(posts))
+        if not posts:
+            return new_posts
+
+        posts.sort(key=lambda p: p.post_id, reverse=True)
+        existing = db_existing_post_ids(conn, channel, [p.post_id for p in posts])
+        for p in posts:
+            if p.post_id in existing:
+                return new_posts
+            new_posts += 1
+            queue_post(writer, p)
+
+        next_before = posts[-1].post_id
+        if next_before == before or next_before <= 1:
+            return new_posts
+        before = next_before
+        pause(sleep_sec)
+
+    logging.warning(
+        "Watch: no known post within %d pages; run a regular update to fill the gap.", max_pages,
+    )
+    return new_posts
+
+
+def run_watch_mode(
+    conn: sqlite3.Connection,
+    channel: str,
+    session: requests.Session,
+    export_path: Optional[str],
+    checkpoint_path: Optional[str],
+    events_jsonl: Optional[str],
+    min_interval: float,
+    max_interval: float,
+    max_pages: int,
+    sleep_sec: float = 0.0,
+    batch_size: int = 200,
+    cycles: int = 0,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """
+    Долгоживущий процесс: одна HTTP-сессия (keep-alive) и одно соединение с БД на всё время,
+    опрос свежей страницы ленты по PollScheduler, экспорт — только когда появились новые события.
+    cycles > 0 — остановиться после стольких опросов; stop — внешний сигнал остановки.
+    """
+    stop = stop or threading.Event()
+    writer = DbWriter(conn, batch_size=batch_size)
+    publisher = EventsPublisher(conn, channel, export_path)
+    scheduler = PollScheduler(min_interval, max_interval)
+    scheduler.set_cadence(db_typical_post_gap(conn, channel))
+    rate_controller = getattr(session, "rate_controller", None)
+
+    # выгрузки могли отстать от базы (например, после --reextract) — догоняем один раз на старте
+    if publisher.enabled:
+        publisher.export()
+
+    logging.info(
+        "Watch: polling %s every %.0f..%.0fs (cadence ceiling %.0fs)",
+        channel, scheduler.min_interval, scheduler.max_interval, scheduler.ceiling,
+    )
+    polls = 0
+    last_new_at = None
+    while not stop.is_set():
+        polls += 1
+        STATS.count("polls")
+        events_before = writer.inserted_events
+        try:
+            new_posts = poll_new_posts(conn, session, channel, writer, max_pages, sleep_sec)
+        except Exception as e:
+            logging.warning("Watch: poll failed: %s", e)
+            new_posts = 0
+            delay = scheduler.on_error()
+        else:
+            delay = None
+
+        # то, что успели разобрать, пишем и при ошибке посреди опроса
+        for ev in writer.flush():
+            if events_jsonl:
+                append_jsonl(events_jsonl, asdict(ev))
+        new_events = writer.inserted_events - events_before
+
+        if new_posts:
+            last_new_at = now_iso()
+            scheduler.set_cadence(db_typical_post_gap(conn, channel))
+        if new_events and publisher.enabled:
+            cnt = publisher.export()
+            logging.info("Exported %d events -> %s", cnt, publisher.targets)
+        if rate_controller is not None:
+            db_save_rates(conn, rate_controller.rates())
+        if delay is None:
+            delay = scheduler.on_poll(new_posts)
+
+        if new_posts:
+            logging.info("Watch: +%d posts, +%d events; next poll in %.0fs", new_posts, new_events, delay)
+        else:
+            logging.debug("Watch: no new posts; next poll in %.0fs", delay)
+
+        if checkpoint_path:
+            atomic_write_json(
+                checkpoint_path,
+                {
+                    "channel": channel,
+                    "mode": "watch",
+                    "polls": polls,
+                    "inserted_posts": writer.inserted_posts,
+                    "inserted_events": writer.inserted_events,
+                    "last_new_post_at": last_new_at,
+                    "next_poll_in_s": round(delay, 1),
+                    "updated_at": now_iso(),
+                    "stats": STATS.summary(),
+                },
+            )
+
+        if cycles and polls >= cycles:
+            break
+        STATS.count("idle_s", delay)
+        stop.wait(delay)
+
+    logging.info("Watch stopped after %d polls: %d new posts, %d new events",
+                 polls, writer.inserted_posts, writer.inserted_events)
+
+
+# ---------- несколько каналов ----------
+
+CHANNEL_RE = re.compile(r"^[A-Za-z0-9_]{3,64}$")
+
+def parse_channels(spec: str, path: Optional[str] = None) -> List[str]:
+    """
+    Каналы из --channel ("a,b,c", можно с @ и ссылками t.me/...) и файла --channels-file
+    (один на строку, "# " — комментарий). Порядок сохраняется, повторы убираются.
+    """
+    items = [x for x in spec.split(",")] if spec else []
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            items += [ln for ln in f if not ln.strip().startswith("# ")]
+    out = []
+    for x in items:
+        x = x.strip().rstrip("/")
+        if not x:
+            continue
+        x = x.rsplit("/", 1)[-1].lstrip("@")
+        if not CHANNEL_RE.match(x):
+            raise ValueError(f"bad channel name: {x!r}")
+        out.append(x)
+    return list(dict.fromkeys(out))
+
+
+def run_channels_mode(
+    db_path: str,
+    channels: List[str],
+    session: requests.Session,
+    workers: int,
+    export_path: Optional[str],
+    checkpoint_path: Optional[str],
+    backfill: bool = False,
+    backfill_restart: bool = False,
+    **update_kwargs,
+) -> None:
+    """
+    run_update_mode (или run_backfill_mode) по каждому каналу в своём потоке (не больше workers одновременно).
+    У потока своё соединение с БД; HTTP-сессия — общая, с общим пулом соединений и общим
+    темпом запросов на хост (rate_controller сессии). Чекпоинты каналов — в channel_state,
+    в checkpoint_path — сводка по всем. В конце — выгрузки каналов и общая.
+    """
+    def crawl(channel: str) -> None:
+        threading.current_thread().name = channel  # для %(threadName)s в логе
+        conn = db_connect(db_path)
+        try:
+            common = dict(conn=conn, channel=channel, export_path=export_path, checkpoint_path=None, session=session)
+            if backfill:
+                # у догрузки свои правила остановки (см. run_backfill_mode)
+                kwargs = {
+                    k: v for k, v in update_kwargs.items()
+                    if k not in ("max_posts", "stop_after_known", "recheck_last", "recheck_days")
+                }
+                run_backfill_mode(restart=backfill_restart, **common, **kwargs)
+            else:
+                run_update_mode(**common, **update_kwargs)
+        finally:
+            conn.close()
+
+    logging.info("Crawling %d channels, %d at a time: %s", len(channels), workers, ", ".join(channels))
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(crawl, ch): ch for ch in channels}
+        for fut, ch in futures.items():
+            try:
+                fut.result()
+            except Exception as e:
+                # остальные каналы дорабатывают, прогресс упавшего — в его чекпоинте
+                failed.append(ch)
+                logging.exception("Channel %s failed: %s", ch, e)
+
+    mode = "backfill" if backfill else "update"
+    conn = db_connect(db_path)
+    try:
+        cnt = export_channels(conn, channels, export_path)
+        if export_path:
+            logging.info("Merged export: %d events -> %s", cnt, export_path)
+        if checkpoint_path:
+            atomic_write_json(
+                checkpoint_path,
+                {
+                    "mode": mode,
+                    "channels": {ch: db_load_channel_state(conn, ch, mode) for ch in channels},
+                    "failed": failed,
+                    "updated_at": now_iso(),
+                },
+            )
+    finally:
+        conn.close()
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(channels)} channels failed: {', '.join(failed)}")
+
+
+# ---------- переразбор сохранённых постов ----------
+
+def post_from_row(row: tuple) -> TelegramPost:
+    channel, post_id, post_url, published_at, text, links_json = row
+    links = [(l["href"], l["text"]) for l in json.loads(links_json or "[]")]
+    return TelegramPost(
+        channel=channel,
+        post_id=post_id,
+        post_url=post_url,
+        published_at=datetime.fromisoformat(published_at) if published_at else None,
+        text=text or "",
+        links=links,
+    )
+
+def db_iter_post_rows(
+    conn: sqlite3.Connection,
+    channel: str,
+    from_id: Optional[int] = None,
+    to_id: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    chunk_size: int = 500,
+) -> Iterator[List[tuple]]:
+    """
+    Посты канала чанками по возрастанию post_id (keyset-пагинация: между чанками
+    можно писать в ту же БД). since/until — даты публикации YYYY-MM-DD включительно.
+    """
+    last = (from_id - 1) if from_id is not None else -1
+    while True:
+        q = """
+            SELECT channel, post_id, post_url, published_at, text, links_json
+            FROM posts
+            WHERE channel=? AND post_id > ?
+        """
+        params: list = [channel, last]
+        if to_id is not None:
+            q += " AND post_id <= ?"
+            params.append(to_id)
+        if since:
+            q += " AND substr(published_at, 1, 10) >= ?"
+            params.append(since)
+        if until:
+            q += " AND substr(published_at, 1, 10) <= ?"
+            params.append(until)
+        q += " ORDER BY post_id LIMIT ?"
+        params.append(chunk_size)
+
+        rows = conn.execute(q, params).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][1]
+
+def reextract_rows(rows: List[tuple]) -> List[Tuple[str, int, List[str], Optional[List[Event]]]]:
+    """
+    Классификация и извлечение событий для чанка строк posts (выполняется в процессе пула).
+    events=None — извлечение упало, старые события поста трогать не надо.
+    """
+    out = []
+    for row in rows:
+        post = post_from_row(row)
+        keywords = scan_keywords(post.text)
+        hints = match_event_hints(post.text, keywords)
+        try:
+            events: Optional[List[Event]] = extract_events_from_post(post, keywords) if hints else []
+        except Exception:
+            events = None
+        out.append((post.channel, post.post_id, hints, events))
+    return out
+
+def run_reextract_mode(
+    conn: sqlite3.Connection,
+    channel: str,
+    export_path: Optional[str],
+    from_id: Optional[int] = None,
+    to_id: Optional[int] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    workers: int = 0,
+    chunk_size: int = 500,
+    extra_hints: Optional[List[str]] = None,
+) -> None:
+    """
+    Заново классифицирует и извлекает события из уже сохранённых постов (без сети)
+    и заменяет ими строки events. Нужен после правок extract_events_from_post,
+    pick_location, разбора дат и т.п.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = db_iter_post_rows(conn, channel, from_id, to_id, since, until, chunk_size)
+
+    posts = ins = upd = dele = failed = 0
+    pool = None
+    if workers > 1:
+        # подсказки канала — через initializer, чтобы работало и при spawn (Windows)
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=set_extra_event_hints,
+            initargs=(extra_hints or [],),
+        )
+        results = (fut.result() for _, fut in iter_prefetched(chunks, lambda rows: pool.submit(reextract_rows, rows), workers * 2))
+    else:
+        results = (reextract_rows(rows) for rows in chunks)
+
+    try:
+        for chunk in results:
+            items = []
+            hint_rows = []
+            for ch, post_id, hints, events in chunk:
+                hint_rows.append((json.dumps(hints, ensure_ascii=False), ch, post_id))
+                if events is None:
+                    failed += 1
+                    logging.warning("Reextract: extraction failed for post_id=%d, events kept", post_id)
+                    continue
+                items.append((ch, post_id, events))
+
+            with STATS.stage("db_write"):
+                i, u, d = db_replace_post_events(conn, items)
+            with STATS.stage("db_write"), conn:
+                conn.executemany("UPDATE posts SET hints_json=? WHERE channel=? AND post_id=?", hint_rows)
+            posts += len(chunk)
+            STATS.count("posts", len(chunk))
+            ins, upd, dele = ins + i, upd + u, dele + d
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    logging.info(
+        "Reextract: %d posts, events +%d ~%d -%d, failed %d (workers=%d)",
+        posts, ins, upd, dele, failed, workers,
+    )
+
+    publisher = EventsPublisher(conn, channel, export_path)
+    if publisher.enabled:
+        cnt = publisher.export()
+        logging.info("Exported %d events -> %s", cnt, publisher.targets)
+
+
+# ---------- поиск по архиву (FTS5) ----------
+
+# колонки FTS-таблиц: фильтр column: в запросе допустим только с ними
+FTS_COLUMNS = {"events": ("title", "location", "raw_text"), "posts": ("text",)}
+FTS_OPERATORS_RE = re.compile(r'["*()^:]|\b(?:AND|OR|NOT|NEAR)\b')
+FTS_PHRASE_RE = re.compile(r'"[^"]*"')
+FTS_FILTER_RE = re.compile(r"(?:\{([\w\s]*)\}|(\w+))\s*:")
+
+def fts_plain_query(q: str) -> str:
+    """Все слова обязательны и ищутся по префиксу: лекция -> "лекция"*."""
+    return " ".join(f'"{w}"*' for w in re.findall(r"\w+", q))
+
+def fts_is_syntax(q: str, columns: Iterable[str]) -> bool:
+    """
+    Похож ли запрос на синтаксис FTS5, а не на просто текст: парные кавычки и скобки,
+    column: — только с настоящей колонкой, ^ — в начале слова, * — после слова или фразы.
+    "Встреча 18:00" или "(см. выше" синтаксисом не считаются.
+    """
+    if not FTS_OPERATORS_RE.search(q) or q.count('"') % 2:
+        return False
+    # фразы в кавычках — одно слово, внутри них операторов нет
+    bare = FTS_PHRASE_RE.sub("x", q)
+    depth = 0
+    for ch in bare:
+        depth += (ch == "(") - (ch == ")")
+        if depth < 0:
+            return False
+    if depth:
+        return False
+    filters = FTS_FILTER_RE.findall(bare)
+    names = {n for group, name in filters for n in (group.split() or [name])}
+    if bare.count(":") != len(filters) or not names <= set(columns):
+        return False
+    if re.search(r"(?<=[^\s(:])\^|\^(?!\w)", bare) or re.search(r"(?<!\w)\*", bare):
+        return False
+    return True
+
+def fts_query(q: str, columns: Iterable[str] = ()) -> str:
+    """Запрос для MATCH: настоящий синтаксис FTS5 — как есть, иначе fts_plain_query."""
+    return q if fts_is_syntax(q, columns) else fts_plain_query(q)
+
+def search_archive(
+    conn: sqlite3.Connection,
+    query: str,
+    target: str = "events",
+    channel: Optional[str] = None,
+    limit: int = 20,
+) -> List[dict]:
+    """Результаты по релевантности (bm25, меньше — лучше) со сниппетами, совпадения в [ ]."""
+    if target == "posts":
+        sql = """
+            SELECT p.channel, p.post_id, p.post_url, p.published_at, NULL,
+                   snippet(posts_fts, 0, '[', ']', '…', 16), bm25(posts_fts) AS score
+            FROM posts_fts JOIN posts p ON p.rowid = posts_fts.rowid
+            WHERE posts_fts MATCH ?
+        """
+    else:
+        # совпадение в заголовке весит больше, чем в месте и тексте
+        sql = """
+            SELECT e.channel, e.source_post_id, e.source_post_url, e.published_at, e.title,
+                   snippet(events_fts, -1, '[', ']', '…', 16), bm25(events_fts, 5.0, 2.0, 1.0) AS score
+            FROM events_fts JOIN events e ON e.id = events_fts.rowid
+            WHERE events_fts MATCH ?
+        """
+    params: list = []
+    if channel:
+        sql += " AND channel = ?"
+        params.append(channel)
+    sql += " ORDER BY score LIMIT ?"
+    params.append(limit)
+
+    match = fts_query(query, FTS_COLUMNS[target])
+    try:
+        rows = conn.execute(sql, [match, *params]).fetchall()
+    except sqlite3.OperationalError as e:
+        plain = fts_plain_query(query)
+        if match == plain:
+            raise
+        # похоже на синтаксис, но FTS5 его не принял — ищем как по обычным словам
+        logging.info("FTS5 rejected %r (%s), searching for plain words", query, e)
+        rows = conn.execute(sql, [plain, *params]).fetchall()
+
+    cols = ("channel", "post_id", "url", "published_at", "title", "snippet", "score")
+    return [dict(zip(cols, r)) for r in rows]
+
+def run_search_mode(
+    conn: sqlite3.Connection,
+    query: str,
+    target: str,
+    channel: Optional[str],
+    limit: int,
+) -> int:
+    if not db_has_fts(conn):
+        logging.error("Full-text search is unavailable: this SQLite build has no FTS5")
+        return 2
+    try:
+        with STATS.stage("search"):
+            results = search_archive(conn, query, target, channel, limit)
+    except sqlite3.OperationalError as e:
+        logging.error("Bad search query %r: %s", query, e)
+        return 2
+
+    for r in results:
+        date = (r["published_at"] or "")[:10]
+        head = f"{r['score']:7.2f}  {r['channel']}/{r['post_id']}  {date}  {r['url']}"
+        print(head)
+        if r["title"]:
+            print(f"         {r['title']}")
+        print("         " + " ".join(r["snippet"].split()))
+    logging.info("Search: %d results for %r in %s", len(results), query, target)
+    return 0
 
 
 # ---------- main ----------
@@ -786,11 +3594,38 @@ def parse_ids_list(s: str) -> List[int]:
 
 def main():
     ap = argparse.ArgumentParser(description="Telegram public channel events parser (with SQLite progress + checkpoints)")
-    ap.add_argument("--channel", default="bcmsu", help="username канала без @")
+    ap.add_argument("--channel", default=None, help="username канала без @; несколько — через запятую")
+    ap.add_argument("--channels-file", default=None,
+                    help="файл со списком каналов (по одному на строку, '# ' — комментарий), вдобавок к --channel")
+    ap.add_argument("--channel-workers", type=int, default=2,
+                    help="сколько каналов качать одновременно (темп запросов к t.me при этом общий)")
     ap.add_argument("--db", default="tg_events.sqlite", help="SQLite файл прогресса")
     ap.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
     ap.add_argument("--sleep", type=float, default=1.4, help="пауза между запросами (сек)")
 
+    # asyncio engine
+    ap.add_argument("--async", dest="async_fetch", action="store_true",
+                    help="качать страницы параллельно (asyncio) вместо --sleep между запросами")
+    ap.add_argument("--concurrency", type=int, default=4, help="макс. одновременных запросов для --async")
+    ap.add_argument("--rate", type=float, default=1.5,
+                    help="макс. запросов в секунду на хост (потолок адаптивного темпа или фиксированный лимит --async)")
+    ap.add_argument("--no-adaptive", dest="adaptive", action="store_false",
+                    help="без адаптивного темпа: фиксированные --sleep/--rate и бэкофф только после 429")
+    # raw HTML cache
+    ap.add_argument("--cache-dir", default=None,
+                    help="кэш скачанных страниц (условные запросы ETag/Last-Modified, 304 -> из кэша)")
+    ap.add_argument("--offline", action="store_true",
+                    help="без сети: разбирать только страницы из --cache-dir")
+    ap.add_argument("--base-url", default="https://t.me",
+                    help="откуда качать страницы (например, http://127.0.0.1:8080 для tools/fake_telegram.py)")
+    ap.add_argument("--event-hints", default=None,
+                    help="файл с доп. словами-подсказками анонсов для канала (по одному на строку)")
+    ap.add_argument("--html-backend", default="auto", choices=HTML_BACKENDS,
+                    help="разбор HTML: lxml (быстрее) или bs4; auto — lxml, если установлен")
+    ap.add_argument("--profile", default=None,
+                    help="записать профиль cProfile запуска в этот файл (python -m pstats FILE); "
+                         "потоки --async не профилируются")
+
     # update mode
     ap.add_argument("--max-pages", type=int, default=12, help="лимит страниц ленты (1 запрос = 1 страница)")
     ap.add_argument("--max-posts", type=int, default=250, help="лимит постов на запуск")
@@ -798,30 +3633,216 @@ def main():
 
     # checkpoints & export
     ap.add_argument("--export", default="events.json", help="куда экспортировать полный JSON (перезапись атомарно)")
+    ap.add_argument("--export-shards", default=None,
+                    help="каталог для шардов событий по месяцам/годам + manifest.json (вдобавок к --export)")
+    ap.add_argument("--shard-by", default="month", choices=sorted(SHARD_BY), help="размер шарда для --export-shards")
+    ap.add_argument("--export-format", default="full", choices=EXPORT_FORMATS,
+                    help="full — как раньше; compact — текст поста один раз в разделе posts (формат версии 2)")
+    ap.add_argument("--stream-export", action="store_true",
+                    help="писать --export потоком, с постоянной памятью: *.ndjson/*.jsonl — по событию на строку, "
+                         "иначе JSON формата full")
+    ap.add_argument("--minify", action="store_true", help="писать --export без отступов")
+    ap.add_argument("--preview-chars", type=int, default=0,
+                    help="compact: вместо полного текста поста — превью такой длины (0 — полный текст)")
+    ap.add_argument("--search-index", default=None,
+                    help="файл поискового индекса для страницы событий (например, public/assets/data/events-index.json)")
+    ap.add_argument("--no-stem", dest="search_stem", action="store_false",
+                    help="--search-index: без отрезания окончаний")
+    ap.add_argument("--precompress", default=None,
+                    help="каталог статики (например, public/assets/data): после экспорта положить .gz/.br "
+                         "рядом с изменившимися *.json и обновить precompressed.json")
+    ap.add_argument("--precompress-only", action="store_true",
+                    help="только пересжать --precompress (например, после правки forum-stats.json) и выйти")
     ap.add_argument("--checkpoint-file", default="checkpoint.json", help="файл с прогрессом (атомарно)")
-    ap.add_argument("--checkpoint-every", type=int, default=40, help="делать чекпоинт каждые N вставок (posts+events)")
+    ap.add_argument("--checkpoint-every", type=int, default=40, help="делать чекпоинт каждые N вставок (posts+events); на чекпоинтах обновляются только шарды, --export и --search-index — в конце запуска")
     ap.add_argument("--events-jsonl", default=None, help="если задано — писать новые события построчно (JSONL)")
+    ap.add_argument("--batch-size", type=int, default=200, help="макс. строк в одной транзакции записи в SQLite")
 
     # targeted fetch/repair
     ap.add_argument("--fetch-ids", default=None, help="скачать точечно только эти id, например: 123,124,130")
     ap.add_argument("--repair-missing", action="store_true", help="добрать отсутствующие id в диапазоне уже сохранённых")
     ap.add_argument("--repair-limit", type=int, default=120, help="сколько id максимум пытаться добрать за запуск")
 
+    # offline re-extraction
+    ap.add_argument("--reextract", action="store_true",
+                    help="заново извлечь события из сохранённых постов (без сети) и обновить events")
+    ap.add_argument("--from-id", type=int, default=None, help="--reextract: начиная с этого post_id")
+    ap.add_argument("--to-id", type=int, default=None, help="--reextract: по этот post_id включительно")
+    ap.add_argument("--since", default=None, help="--reextract: посты, опубликованные с YYYY-MM-DD")
+    ap.add_argument("--until", default=None, help="--reextract: посты, опубликованные по YYYY-MM-DD")
+    ap.add_argument("--workers", type=int, default=0, help="--reextract: процессов в пуле (0 — по числу CPU)")
+
+    # перепроверка правок
+    ap.add_argument("--recheck-last", type=int, default=0,
+                    help="сравнивать с базой последние N известных постов и обновлять отредактированные (0 — выкл.)")
+    ap.add_argument("--recheck-days", type=float, default=0.0,
+                    help="то же для постов, опубликованных за последние D дней (0 — выкл.)")
+
+    # backfill
+    ap.add_argument("--backfill", action="store_true",
+                    help="догружать историю вглубь с сохранённого в базе курсора, по --max-pages страниц за запуск")
+    ap.add_argument("--backfill-restart", action="store_true", help="--backfill: забыть курсор и начать со старейшего поста в базе")
+    ap.add_argument("--backfill-workers", type=int, default=1,
+                    help="--backfill: > 1 — делить историю на диапазоны id и качать их параллельно (темп запросов общий)")
+    ap.add_argument("--partition-size", type=int, default=500, help="--backfill-workers: постов в диапазоне")
+
+    # watch
+    ap.add_argument("--watch", action="store_true",
+                    help="не выходить: опрашивать свежую страницу ленты с интервалом, подстроенным под частоту постов канала")
+    ap.add_argument("--watch-min", type=float, default=60.0, help="--watch: минимальный интервал опроса (сек)")
+    ap.add_argument("--watch-max", type=float, default=1800.0, help="--watch: максимальный интервал опроса (сек)")
+    ap.add_argument("--watch-cycles", type=int, default=0, help="--watch: остановиться после N опросов (0 — работать до SIGINT/SIGTERM)")
+
+    # full-text search
+    ap.add_argument("--search", default=None,
+                    help='полнотекстовый поиск по базе (FTS5) и выход; слова ищутся по префиксу, '
+                         'поддерживается синтаксис FTS5: "точная фраза", OR, NOT, title:слово')
+    ap.add_argument("--search-in", default="events", choices=["events", "posts"], help="--search: где искать")
+    ap.add_argument("--limit", type=int, default=20, help="--search: сколько результатов показать")
+    ap.add_argument("--all-channels", action="store_true", help="--search: по всем каналам базы, а не только --channel")
+    ap.add_argument("--search-rebuild", action="store_true",
+                    help="пересобрать FTS5-индексы из posts/events (например, после VACUUM) и выйти")
+
     args = ap.parse_args()
 
+    try:
+        channels = parse_channels(args.channel or ("" if args.channels_file else "bcmsu"), args.channels_file)
+    except (OSError, ValueError) as e:
+        ap.error(str(e))
+    if not channels:
+        ap.error("no channels given")
+    multi = len(channels) > 1
+    args.channel = channels[0] if not multi else ",".join(channels)
+
     logging.basicConfig(
         level=getattr(logging, args.log_level),
-        format="%(asctime)s | %(levelname)s | %(message)s",
+        # несколько каналов качаются в потоках с именами каналов
+        format="%(asctime)s | %(levelname)s | %(threadName)s | %(message)s" if multi
+        else "%(asctime)s | %(levelname)s | %(message)s",
     )
+    if multi and (args.reextract or args.fetch_ids or args.repair_missing or args.watch):
+        ap.error("several channels are supported only in the default update mode")
+    if multi and args.backfill and args.backfill_workers > 1:
+        ap.error("--backfill-workers works with a single channel")
+
+    if args.precompress_only:
+        if not args.precompress:
+            ap.error("--precompress-only requires --precompress")
+        changed, total = precompress_tree(args.precompress)
+        logging.info(
+            "Precompressed %d of %d files in %s (brotli: %s)",
+            changed, total, args.precompress, "yes" if brotli else "not installed",
+        )
+        return
+
+    logging.info("HTML backend: %s", set_html_backend(args.html_backend))
+    if set_base_url(args.base_url) != "https://t.me":
+        logging.info("Base URL: %s", args.base_url)
+    extra_hints = load_event_hints(args.event_hints) if args.event_hints else []
+    if extra_hints:
+        n = set_extra_event_hints(extra_hints)
+        logging.info("Event hints: %d keywords", n)
 
     conn = db_connect(args.db)
     db_init(conn)
 
+    if args.search_rebuild:
+        if not db_has_fts(conn):
+            logging.error("Full-text search is unavailable: this SQLite build has no FTS5")
+            sys.exit(2)
+        db_rebuild_fts(conn)
+        logging.info("FTS indexes rebuilt")
+        return
+    if args.search:
+        sys.exit(run_search_mode(
+            conn, args.search,
+            target=args.search_in,
+            channel=None if args.all_channels or multi else args.channel,
+            limit=args.limit,
+        ))
+
     # Важно: экспорт можно отключить, если не нужен
     export_path = args.export if args.export else None
+    set_export_options(
+        shards_dir=args.export_shards,
+        shard_by=args.shard_by,
+        precompress_dir=args.precompress,
+        export_format=args.export_format,
+        minify=args.minify,
+        preview_chars=max(0, args.preview_chars),
+        search_index=args.search_index,
+        search_stem=args.search_stem,
+        per_channel=multi,
+        stream=args.stream_export,
+    )
     checkpoint_path = args.checkpoint_file if args.checkpoint_file else None
+    # чекпоинт ведут обновление, догрузка одним потоком, --watch и несколько каналов;
+    # сводку STATS дописываем только к их чекпоинту, остальные режимы его не трогают
+    stats_to_checkpoint = checkpoint_path is not None and not (
+        args.reextract or args.fetch_ids or args.repair_missing
+        or (args.backfill and args.backfill_workers > 1)
+    )
+
+    if args.offline and not args.cache_dir:
+        ap.error("--offline requires --cache-dir")
+    if args.stream_export and args.export_format != "full":
+        # compact собирает раздел posts целиком — потоком его не записать
+        ap.error("--stream-export supports only --export-format full")
+    if args.watch and args.offline:
+        ap.error("--watch cannot be used with --offline")
+    page_cache = PageCache(args.cache_dir, offline=args.offline) if args.cache_dir else None
+    if args.offline:
+        # в кэше лежат страницы по тем курсорам, что были при скачивании, — идём по ним же, без пауз
+        args.async_fetch = False
+        args.sleep = 0.0
+
+    rate_controller = None
+    if args.adaptive and not args.offline:
+        # старт — с выученного в прошлых запусках темпа, для новых хостов — с 1/--sleep
+        rate_controller = AdaptiveRateController(
+            initial_rate=1.0 / args.sleep if args.sleep > 0 else args.rate,
+            max_rate=args.rate,
+        )
+        for host, rate in db_load_rates(conn).items():
+            rate_controller.set_rate(host, rate)
+        # паузы между запросами теперь задаёт контроллер
+        args.sleep = 0.0
+
+    pacer = rate_controller
+    if multi or (args.backfill and args.backfill_workers > 1):
+        # каналы (или диапазоны истории) качаются потоками, страницы — по одной; --async не используется
+        args.async_fetch = False
+        if pacer is None and args.sleep > 0:
+            # без адаптации --sleep — общая пауза на все потоки, а не на каждый
+            fixed = 1.0 / args.sleep
+            pacer = AdaptiveRateController(initial_rate=fixed, min_rate=fixed, max_rate=fixed)
+            args.sleep = 0.0
+
+    session = make_session(
+        pool_size=max(10, args.concurrency, args.channel_workers, args.backfill_workers),
+        page_cache=page_cache,
+        rate_controller=pacer,
+    )
+    engine = AsyncFetchEngine(session, concurrency=args.concurrency, rate=args.rate) if args.async_fetch else None
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
 
     try:
+        if args.reextract:
+            run_reextract_mode(
+                conn, args.channel,
+                export_path=export_path,
+                from_id=args.from_id,
+                to_id=args.to_id,
+                since=args.since,
+                until=args.until,
+                workers=args.workers,
+                extra_hints=extra_hints,
+            )
+            return
+
         if args.fetch_ids:
             ids = parse_ids_list(args.fetch_ids)
             run_fetch_ids_mode(
@@ -829,6 +3850,28 @@ def main():
                 sleep_sec=args.sleep,
                 export_path=export_path,
                 events_jsonl=args.events_jsonl,
+                engine=engine,
+                batch_size=args.batch_size,
+                session=session,
+            )
+            return
+
+        if args.watch:
+            # SIGTERM (systemd, docker stop) — штатная остановка между опросами, как и Ctrl+C
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+            run_watch_mode(
+                conn, args.channel, session,
+                export_path=export_path,
+                checkpoint_path=checkpoint_path,
+                events_jsonl=args.events_jsonl,
+                min_interval=args.watch_min,
+                max_interval=args.watch_max,
+                max_pages=args.max_pages,
+                sleep_sec=args.sleep,
+                batch_size=args.batch_size,
+                cycles=args.watch_cycles,
+                stop=stop,
             )
             return
 
@@ -839,6 +3882,58 @@ def main():
                 sleep_sec=args.sleep,
                 export_path=export_path,
                 events_jsonl=args.events_jsonl,
+                engine=engine,
+                batch_size=args.batch_size,
+                session=session,
+            )
+            return
+
+        if multi:
+            run_channels_mode(
+                args.db, channels, session,
+                workers=max(1, args.channel_workers),
+                export_path=export_path,
+                checkpoint_path=checkpoint_path,
+                backfill=args.backfill,
+                backfill_restart=args.backfill_restart,
+                max_pages=args.max_pages,
+                max_posts=args.max_posts,
+                stop_after_known=args.stop_after_known,
+                sleep_sec=args.sleep,
+                checkpoint_every=args.checkpoint_every,
+                events_jsonl=args.events_jsonl,
+                batch_size=args.batch_size,
+                recheck_last=args.recheck_last,
+                recheck_days=args.recheck_days,
+            )
+            return
+
+        if args.backfill and args.backfill_workers > 1:
+            run_partitioned_backfill_mode(
+                args.db, args.channel, session,
+                workers=args.backfill_workers,
+                partition_size=max(20, args.partition_size),
+                restart=args.backfill_restart,
+                sleep_sec=args.sleep,
+                batch_size=args.batch_size,
+                export_path=export_path,
+                events_jsonl=args.events_jsonl,
+            )
+            return
+
+        if args.backfill:
+            run_backfill_mode(
+                conn, args.channel,
+                max_pages=args.max_pages,
+                restart=args.backfill_restart,
+                sleep_sec=args.sleep,
+                checkpoint_every=args.checkpoint_every,
+                export_path=export_path,
+                checkpoint_path=checkpoint_path,
+                events_jsonl=args.events_jsonl,
+                engine=engine,
+                batch_size=args.batch_size,
+                session=session,
             )
             return
 
@@ -854,12 +3949,16 @@ def main():
             export_path=export_path,
             checkpoint_path=checkpoint_path,
             events_jsonl=args.events_jsonl,
+            engine=engine,
+            batch_size=args.batch_size,
+            session=session,
+            recheck_last=args.recheck_last,
+            recheck_days=args.recheck_days,
         )
 
     except KeyboardInterrupt:
         logging.warning("Interrupted by user. Exporting checkpoint...")
-        if export_path:
-            export_events_json(conn, args.channel, export_path)
+        export_channels(conn, channels, export_path)
         if checkpoint_path:
             atomic_write_json(checkpoint_path, {"channel": args.channel, "interrupted_at": now_iso()})
         sys.exit(0)
@@ -867,11 +3966,10 @@ def main():
     except Exception as e:
         # Максимально стараемся не терять прогресс
         logging.exception("Fatal error: %s", e)
-        if export_path:
-            try:
-                export_events_json(conn, args.channel, export_path)
-            except Exception:
-                logging.exception("Export after fatal error failed.")
+        try:
+            export_channels(conn, channels, export_path)
+        except Exception:
+            logging.exception("Export after fatal error failed.")
         if checkpoint_path:
             try:
                 atomic_write_json(checkpoint_path, {"channel": args.channel, "fatal_at": now_iso(), "error": str(e)})
@@ -880,6 +3978,26 @@ def main():
         # обычный ненулевой код
         sys.exit(1)
 
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logging.info("Profile written: %s", args.profile)
+        if engine is not None:
+            engine.close()
+        session.close()
+        if rate_controller is not None:
+            rates = rate_controller.rates()
+            db_save_rates(conn, rates)
+            logging.info("Adaptive rate: %s", ", ".join(f"{h} {r:.2f} req/s" for h, r in rates.items()) or "no requests")
+
+        logging.info("Run stats:\n%s", STATS.report())
+        if stats_to_checkpoint:
+            try:
+                write_checkpoint_stats(checkpoint_path)
+            except OSError:
+                logging.exception("Failed to write stats to %s", checkpoint_path)
+
 
 if __name__ == "__main__":
     main()